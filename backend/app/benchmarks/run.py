@@ -0,0 +1,290 @@
+"""
+Benchmark suite (run from backend/app, fully offline):
+
+    python -m benchmarks.run --assets 8 --days 1500
+    python -m benchmarks.run --assets 2000 --days 500 --stages frontier initial_portfolio
+    python -m benchmarks.run --http --requests 500 --concurrency 16
+    python -m benchmarks.run --compare benchmarks/results/<previous>.json
+
+A synthetic N assets x T days panel (fixed seed) replaces prices.csv; the RAG engine and
+the database are stubbed. Each stage reports latency percentiles, throughput and the peak
+memory traced during one extra run; the HTTP mode load-tests /submit_profile (or
+/generate_pdf) on a local uvicorn. Results are written as JSON for run-to-run comparison.
+"""
+import argparse
+import contextlib
+import http.client
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.stubs import install_stubs, use_panel
+from benchmarks.synthetic import make_payloads, make_prices, write_panel_csv
+
+STAGES = ["classify_profile", "initial_portfolio", "frontier", "historical_performance", "submit_profile"]
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def summarize(latencies: List[float], wall: float, peak_bytes: Optional[int] = None) -> dict:
+    ms = np.asarray(latencies) * 1000.0
+    summary = {
+        "count": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "throughput_per_s": len(ms) / wall if wall else 0.0,
+    }
+    if peak_bytes is not None:
+        summary["peak_memory_mb"] = peak_bytes / 2 ** 20
+    return summary
+
+
+def measure(fn: Callable[[], object], repeat: int, warmup: int) -> dict:
+    """Time `repeat` calls after `warmup` untimed ones, then trace the memory of one more."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(warmup):
+            fn()
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            latencies.append(time.perf_counter() - t0)
+        wall = time.perf_counter() - started
+
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return summarize(latencies, wall, peak)
+
+
+def stage_functions(payloads: List[dict]) -> Dict[str, Callable[[], object]]:
+    """The benchmarked calls; services are imported here, after the panel is set up."""
+    from fastapi.testclient import TestClient
+
+    import main
+    from services.frontier import frontier_cache
+    from services.market_data import market_data
+    from services.moments import clear_moments_cache
+    from services.pipeline import recommendation_pipeline
+    from services.portfolio_engine import (
+        compute_efficient_frontier_points,
+        compute_historical_performance,
+        generate_initial_portfolio,
+        invalidate_profile_portfolios,
+    )
+    from services.profiling import classify_profile
+
+    prices = market_data.prices()
+    weights = {t: w for t, w in generate_initial_portfolio("modéré").items() if w > 0}
+    questionnaires = itertools.cycle(payloads)
+    requests = itertools.cycle(payloads)
+    client = TestClient(main.app)
+    client.__enter__()  # runs the lifespan (tables, writer, precomputed profiles)
+
+    def classify():
+        p = next(questionnaires)
+        return classify_profile(p["age"], p["risk_aversion"], p["horizon"], p["revenu"], p["objectif"], p["esg_preference"])
+
+    def initial_portfolio():
+        # Cold: moments and the three profile solves
+        invalidate_profile_portfolios()
+        clear_moments_cache()
+        return generate_initial_portfolio("modéré")
+
+    def frontier():
+        frontier_cache.invalidate()
+        clear_moments_cache()
+        return compute_efficient_frontier_points(prices)
+
+    def historical():
+        return compute_historical_performance(prices, weights)
+
+    def submit():
+        # Computed each time (result cache cleared), profiles and frontier warm as in production
+        recommendation_pipeline.clear()
+        response = client.post("/submit_profile", json=next(requests))
+        response.raise_for_status()
+
+    return {
+        "classify_profile": classify,
+        "initial_portfolio": initial_portfolio,
+        "frontier": frontier,
+        "historical_performance": historical,
+        "submit_profile": submit,
+    }
+
+
+def _wait_until_up(port: int, process: subprocess.Popen, timeout: float = 300.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Benchmark server exited during startup")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/readyz")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("Benchmark server did not start in time")
+
+
+def _peak_rss_mb(pid: int) -> Optional[float]:
+    """VmHWM of a process (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def run_http(workdir: str, payloads: List[dict], args) -> dict:
+    """Load-test a local uvicorn serving the app on the synthetic panel."""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.server", "--workdir", workdir, "--port", str(args.port)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        _wait_until_up(args.port, server)
+        path = f"/{args.endpoint}"
+        bodies = [json.dumps(p).encode() for p in payloads]
+        per_worker = [range(w, args.requests, args.concurrency) for w in range(args.concurrency)]
+
+        def worker(indices) -> List[tuple]:
+            conn = http.client.HTTPConnection("127.0.0.1", args.port, timeout=120)
+            results = []
+            for i in indices:
+                t0 = time.perf_counter()
+                conn.request("POST", path, body=bodies[i % len(bodies)], headers={"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                results.append((time.perf_counter() - t0, response.status))
+            conn.close()
+            return results
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            results = [r for chunk in pool.map(worker, per_worker) for r in chunk]
+        wall = time.perf_counter() - started
+
+        summary = summarize([latency for latency, _ in results], wall)
+        summary["errors"] = sum(status >= 400 for _, status in results)
+        summary["concurrency"] = args.concurrency
+        summary["endpoint"] = path
+        summary["server_peak_rss_mb"] = _peak_rss_mb(server.pid)
+        return summary
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline: dict) -> None:
+    """Print p50 / throughput ratios against a previous result file."""
+    rows = [(name, stats, baseline.get("stages", {}).get(name)) for name, stats in current.get("stages", {}).items()]
+    if "http" in current:
+        rows.append(("http", current["http"], baseline.get("http")))
+    print(f"{'stage':<24}{'p50 ms':>12}{'baseline':>12}{'ratio':>8}{'thr ratio':>11}")
+    for name, stats, base in rows:
+        if not base:
+            print(f"{name:<24}{stats['p50_ms']:>12.2f}{'-':>12}")
+            continue
+        ratio = stats["p50_ms"] / base["p50_ms"] if base["p50_ms"] else float("nan")
+        throughput = stats["throughput_per_s"] / base["throughput_per_s"] if base["throughput_per_s"] else float("nan")
+        print(f"{name:<24}{stats['p50_ms']:>12.2f}{base['p50_ms']:>12.2f}{ratio:>8.2f}{throughput:>11.2f}")
+
+
+def main(argv: Optional[List[str]] = None) -> dict:
+    parser = argparse.ArgumentParser(description="Robo-advisor benchmarks")
+    parser.add_argument("--assets", type=int, default=8, help="N assets of the synthetic panel")
+    parser.add_argument("--days", type=int, default=1500, help="T days of the synthetic panel")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--stages", nargs="*", choices=STAGES, default=STAGES)
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per stage")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--http", action="store_true", help="Also load-test a local uvicorn")
+    parser.add_argument("--endpoint", choices=["submit_profile", "generate_pdf"], default="submit_profile")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="JSON file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Previous JSON result to compare with")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="robo-bench-")
+    prices_path = write_panel_csv(make_prices(args.assets, args.days, args.seed), workdir)
+    install_stubs(workdir)
+    use_panel(prices_path, workdir)
+    payloads = make_payloads(max(args.requests, args.repeat + args.warmup + 1), args.seed)
+
+    result = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "assets": args.assets,
+            "days": args.days,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            # Peak memory of the solve stages is only comparable with the same setting
+            "solver_workers": int(os.environ["SOLVER_WORKERS"]),
+        },
+        "stages": {},
+    }
+
+    if args.stages:
+        functions = stage_functions(payloads)
+        for name in args.stages:
+            # Profile classification is microseconds: time many more calls
+            repeat = args.repeat * 100 if name == "classify_profile" else args.repeat
+            result["stages"][name] = stats = measure(functions[name], repeat, args.warmup)
+            print(f"{name:<24} p50 {stats['p50_ms']:9.3f} ms  p99 {stats['p99_ms']:9.3f} ms  "
+                  f"{stats['throughput_per_s']:10.1f}/s  peak {stats['peak_memory_mb']:8.1f} MB")
+
+    if args.http:
+        result["http"] = stats = run_http(workdir, payloads, args)
+        print(f"{'http ' + stats['endpoint']:<24} p50 {stats['p50_ms']:9.3f} ms  p99 {stats['p99_ms']:9.3f} ms  "
+              f"{stats['throughput_per_s']:10.1f}/s  errors {stats['errors']}")
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results: {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""
+API server for the HTTP benchmark: the real app on a synthetic panel, with RAG and DB stubbed.
+    python -m benchmarks.server --workdir /tmp/bench --port 8765
+"""
+import argparse
+
+import uvicorn
+
+from benchmarks.stubs import install_stubs, use_panel
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workdir", required=True, help="Directory holding the synthetic prices.csv")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    install_stubs(args.workdir)
+    use_panel(f"{args.workdir}/prices.csv", args.workdir)
+
+    import main
+
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,31 @@
+"""
+Offline stand-ins for the benchmarks: a RAG engine returning canned text (no embedding
+model, no FAISS index) and a SQLite database in the work directory.
+Must be installed before main or services.pipeline are imported.
+
+Solves run inline by default (SOLVER_WORKERS=0): tracemalloc only sees this process, so
+with the solver pool the solve stages would report IPC time and no memory. Set
+SOLVER_WORKERS explicitly to benchmark the pool.
+"""
+import os
+import sys
+import types
+
+
+def install_stubs(workdir: str) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(os.path.abspath(workdir), 'bench.db')}"
+    os.environ.setdefault("SOLVER_WORKERS", "0")
+
+    rag = types.ModuleType("services.rag_engine")
+    rag.get_recommendation_for_profile = lambda profil, threshold=1.0: f"Recommandation ({profil})"
+    rag.warm_up = lambda: True
+    rag.reload_index = lambda: True
+    sys.modules["services.rag_engine"] = rag
+
+
+def use_panel(prices_path: str, workdir: str) -> None:
+    """Point the market-data store at a synthetic panel (before services are imported)."""
+    os.environ["PRICES_PATH"] = prices_path
+    # An empty columnar directory: the CSV is the source, online-moment checkpoints stay local
+    os.environ["MARKET_DATA_DIR"] = os.path.join(workdir, "market_data")
+    os.makedirs(os.environ["MARKET_DATA_DIR"], exist_ok=True)
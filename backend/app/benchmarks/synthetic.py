@@ -0,0 +1,60 @@
+"""Synthetic price panels and questionnaires for the benchmarks (offline, seeded)."""
+import os
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+# Tickers of ASSET_CLASSES first, so the profile allocations still apply
+BASE_TICKERS = ["AAPL", "MSFT", "TSLA", "BND", "AGG", "TLT", "BTC-USD", "ETH-USD"]
+
+RISK_AVERSIONS = ["faible", "moyenne", "élevée"]
+OBJECTIVES = ["préservation du capital", "croissance modérée", "croissance agressive"]
+
+
+def make_prices(n_assets: int, n_days: int, seed: int = 0, n_factors: int = 3) -> pd.DataFrame:
+    """
+    Business-day close prices from a factor model of daily log returns:
+    a few common factors, asset-specific loadings, drift and idiosyncratic noise.
+    """
+    rng = np.random.default_rng(seed)
+    tickers = BASE_TICKERS[:n_assets] + [f"SYN{i:05d}" for i in range(max(n_assets - len(BASE_TICKERS), 0))]
+
+    # Volatilities from bond-like (~3%/yr) to crypto-like (~50%/yr), so every profile is feasible
+    factors = rng.normal(0.0, 0.006, (n_days, n_factors))
+    loadings = rng.normal(0.3, 0.5, (n_factors, n_assets))
+    drift = rng.normal(0.0004, 0.0003, n_assets)
+    noise = rng.normal(0.0, 1.0, (n_days, n_assets)) * rng.uniform(0.002, 0.03, n_assets)
+    log_returns = factors @ loadings + drift + noise
+
+    start = rng.uniform(10.0, 500.0, n_assets)
+    values = start * np.exp(np.cumsum(log_returns, axis=0))
+    dates = pd.bdate_range("2015-01-01", periods=n_days, name="Date")
+    return pd.DataFrame(values, index=dates, columns=tickers)
+
+
+def write_panel_csv(prices: pd.DataFrame, directory: str) -> str:
+    """prices.csv and returns.csv in `directory`; returns the prices path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "prices.csv")
+    prices.to_csv(path)
+    prices.pct_change().dropna().to_csv(os.path.join(directory, "returns.csv"))
+    return path
+
+
+def make_payloads(count: int, seed: int = 0) -> List[dict]:
+    """Valid UserProfileIn payloads (JSON form), spread over all profiles."""
+    rng = np.random.default_rng(seed)
+    payloads = []
+    for i in range(count):
+        age = int(rng.integers(18, 80))
+        payloads.append({
+            "email": f"bench{i}@example.com",
+            "age": age,
+            "revenu": float(rng.integers(10, 300)) * 1000.0,
+            "horizon": int(rng.integers(1, min(40, 100 - age) + 1)),
+            "risk_aversion": RISK_AVERSIONS[rng.integers(len(RISK_AVERSIONS))],
+            "objectif": OBJECTIVES[rng.integers(len(OBJECTIVES))],
+            "esg_preference": bool(rng.integers(2)),
+        })
+    return payloads
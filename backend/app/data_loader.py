@@ -1,29 +1,30 @@
-import yfinance as yf
-import pandas as pd
-import numpy as np
+import argparse
+
 import matplotlib.pyplot as plt
+from services.columnar import MARKET_DATA_DIR, read_frame
+from services.ingestion import CSVProvider, YahooProvider, ingest
 
 tickers = ["AAPL", "MSFT", "TSLA", "BND", "AGG", "TLT", "BTC-USD", "ETH-USD"]
 start_date = "2020-01-01"
-end_date = "2024-08-01"
-
-
-data = yf.download(tickers, start=start_date, end=end_date, group_by='ticker', auto_adjust=True)
-
-
-adj_close = pd.DataFrame({ticker: data[ticker]['Close'] for ticker in tickers})
-
-adj_close.dropna(inplace=True)
-
-
-print(adj_close.head())
+end_date = None  # None : jusqu'à aujourd'hui
 
-adj_close.plot(figsize=(12, 6), title="Prix ajustés des actifs")
-plt.show()
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingestion incrémentale des prix ajustés")
+    parser.add_argument("--full", action="store_true", help="Re-télécharger tout l'historique")
+    parser.add_argument("--end", default=end_date)
+    parser.add_argument("--source-csv", help="Fournisseur local (CSV date x ticker) à la place de Yahoo")
+    parser.add_argument("--plot", action="store_true")
+    args = parser.parse_args()
 
-returns = adj_close.pct_change().dropna()
+    provider = CSVProvider(args.source_csv) if args.source_csv else YahooProvider()
 
+    # Seules les nouvelles barres sont téléchargées, validées et ajoutées (prix, rendements, CSV)
+    result = ingest(provider, tickers, start_date, args.end, full=args.full)
+    print(f"Ingestion {result['mode']} : {result['rows']} nouvelles lignes")
 
-adj_close.to_csv("prices.csv")
-returns.to_csv("returns.csv")
+    if args.plot:
+        adj_close = read_frame(MARKET_DATA_DIR, "prices")
+        print(adj_close.head())
+        adj_close.plot(figsize=(12, 6), title="Prix ajustés des actifs")
+        plt.show()
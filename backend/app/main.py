@@ -1,29 +1,75 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import Tuple
+import time
+# Mesure du temps d'import au démarrage du worker
+BOOT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from typing import Dict, List, Optional, Tuple
 from fastapi.middleware.cors import CORSMiddleware
-from services.portfolio_engine import generate_initial_portfolio, get_assets_for_profile, compute_efficient_frontier_points, compute_historical_performance
-import pandas as pd
-from pypfopt import expected_returns, risk_models, EfficientFrontier
-import numpy as np
-import matplotlib.pyplot as plt
-from fastapi.responses import StreamingResponse
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import inch
-from reportlab.lib.utils import ImageReader
-from io import BytesIO
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+import asyncio
+import contextvars
+import json
+import logging
 import os
+import random
 
 # ⬇️ Importations internes
-from database import Base, engine, SessionLocal
-from models import User
+from database import async_engine, init_db
 from schemas.user import UserProfileIn, UserProfileOut
-from services.profiling import classify_profile
-from services.rag_engine import get_recommendation_for_profile
+from services.profiling import classify_profiles_batch
+from services.pipeline import recommendation_pipeline
+from services.report import PDF_SERIES_POINTS, generate_pdf_report, iter_pdf, pdf_executor
+from services.user_writer import user_writer
+from services.market_data import market_data
+from services import monte_carlo
+from services.monte_carlo import MAX_PATHS, bootstrap_model, default_target, iter_projection, normal_model, run_projection
+from services.warmup import worker_warmup
+from services.series import page, performance_payload
+from services.risk import risk_metrics, risk_report
+from services.solver_service import SolverError, solver_service
+from services.metrics import (
+    HTTP_SECONDS,
+    PROFILE_HEADER_ENABLED,
+    PROFILE_SAMPLE_RATE,
+    render_metrics,
+    start_profile,
+    stop_profile,
+    timed,
+)
+
+# Journalisation à niveaux (LOG_LEVEL=DEBUG pour le détail des calculs)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s %(message)s")
+logger = logging.getLogger("robo_advisor")
+
+# "eager" : le worker n'accepte le trafic qu'après le warm-up ; "fast" : warm-up en arrière-plan, /readyz en 503 d'ici là
+STARTUP_MODE = os.getenv("STARTUP_MODE", "eager")
+IMPORT_SECONDS = time.perf_counter() - BOOT_STARTED
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Création des tables au démarrage (et non à l'import) + écriture différée des utilisateurs
+    await init_db()
+    await user_writer.start()
+    logger.info("Imports: %.2fs (mode de démarrage %s)", IMPORT_SECONDS, STARTUP_MODE)
+    # Warm-up : données, moments, portefeuilles des profils, frontière, index RAG, rendu PDF
+    # En "fast", les étapes en échec sont retentées en arrière-plan ; en "eager", un échec fait échouer
+    # le démarrage pour que l'orchestrateur redémarre le worker
+    if STARTUP_MODE == "fast":
+        worker_warmup.start_background()
+    elif not await run_in_threadpool(worker_warmup.run):
+        raise RuntimeError(f"Warm-up en échec : {worker_warmup.error}")
+    logger.info("Démarrage du worker: %.2fs", time.perf_counter() - BOOT_STARTED)
+    yield
+    worker_warmup.stop()
+    solver_service.shutdown()
+    monte_carlo.shutdown()
+    await user_writer.stop()
+    await async_engine.dispose()
 
 # 🚀 Initialisation de l'app FastAPI
-app = FastAPI(title="Robo-Advisor API", version="0.1.0")
+app = FastAPI(title="Robo-Advisor API", version="0.1.0", lifespan=lifespan)
 
 origins = [
     "http://localhost:5173",
@@ -40,300 +86,256 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Création automatique des tables
-Base.metadata.create_all(bind=engine)
-
-# Dépendance pour la base de données
-def get_db():
-    db = SessionLocal()
+@app.exception_handler(SolverError)
+async def solver_unavailable(request: Request, exc: SolverError):
+    # Pool d'optimisation saturé ou résolution trop longue : le client peut réessayer
+    return JSONResponse({"detail": f"Service d'optimisation indisponible : {exc}"}, status_code=503, headers={"Retry-After": "1"})
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    # Profilage à la demande (en-tête X-Profile) ou sur un échantillon des requêtes
+    profiled = (PROFILE_HEADER_ENABLED and "x-profile" in request.headers) or random.random() < PROFILE_SAMPLE_RATE
+    token = start_profile() if profiled else None
+    started = time.perf_counter()
+    status = 500
     try:
-        yield db
+        response = await call_next(request)
+        status = response.status_code
     finally:
-        db.close()
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=route.path if route is not None else "unmatched",
+            status=str(status),
+        )
+        profile = stop_profile(token) if token is not None else None
+
+    if profile is not None:
+        response.headers["Server-Timing"] = profile.server_timing()
+        logger.info("Profil %s %s:\n%s", request.method, request.url.path, profile.summary())
+    return response
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Format d'exposition Prometheus
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/healthz")
+def healthz():
+    # Vivacité : le processus répond, même pendant le warm-up
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    # Disponibilité : warm-up terminé
+    status = {**worker_warmup.status(), "import_seconds": IMPORT_SECONDS}
+    return JSONResponse(status, status_code=200 if worker_warmup.ready else 503)
 
 @app.get("/")
 def read_root():
     return {"message": "Hello, la base est prête 🐐"}
 
 @app.post("/submit_profile")
-def submit_profile(payload: UserProfileIn, db: Session = Depends(get_db)):
-    # Calcul du score + classification
-    risk_score, profil = classify_profile(
-        age=payload.age,
-        risk_aversion=payload.risk_aversion.value,
-        horizon=payload.horizon,
-        revenu=payload.revenu,
-        objectif=payload.objectif.value,
-        esg_preference=payload.esg_preference
-    )
-
-    portfolio_alloc = generate_initial_portfolio(profil)
-    
-    # Filtrer les allocations à 0%
-    portfolio_alloc = {asset: weight for asset, weight in portfolio_alloc.items() if weight > 0}
-
-    # Charger les prix
-    prices = pd.read_csv("prices.csv", index_col=0, parse_dates=True)
-    prices = prices.dropna(axis=1, how="all")
-    prices = prices.loc[:, (prices != 0).any()]
-
-    if prices.empty:
-        raise HTTPException(status_code=500, detail="Aucun ticker valide trouvé dans les données de prix")
-
-    mu = expected_returns.mean_historical_return(prices)
-    S = risk_models.sample_cov(prices)
-    ef = EfficientFrontier(mu, S)
-
-    valid_weights = {t: w for t, w in portfolio_alloc.items() if t in prices.columns}
-    if not valid_weights:
-        raise HTTPException(status_code=500, detail="No overlap between portfolio_alloc and price data")
-
-    ef_weights = [valid_weights.get(t, 0) for t in ef.tickers]
-    ef.weights = np.array(ef_weights)
-    user_ret, user_risk, _ = ef.portfolio_performance()
-
-    sim_performance = {'error': 'Computation failed'}
-    frontier_points = []
+def submit_profile(
+    payload: UserProfileIn,
+    points: Optional[int] = Query(None, ge=3, description="Sous-échantillonnage de la performance simulée"),
+    downsample: str = Query("lttb", pattern="^(lttb|minmax)$"),
+    encoding: str = Query("json", pattern="^(json|base64)$", description="base64 : dates compactes + float32"),
+):
+    # Résultat calculé une seule fois puis mis en cache : /generate_pdf/{result_id} le réutilise
     try:
-        sim_performance = compute_historical_performance(prices, portfolio_alloc)
-        frontier_points = compute_efficient_frontier_points(prices)
-    except Exception as e:
-        print(f"Visualization computation error: {e}")
-
-    user_point = {'risk': float(user_risk), 'return': float(user_ret)}
-
-    classes_actifs = get_assets_for_profile(profil)
-    rag_response = get_recommendation_for_profile(profil)
+        result_id, entry = recommendation_pipeline.run(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
     # Return without adding to DB
-    return {
-        "age": payload.age,
-        "revenu": payload.revenu,
-        "horizon": payload.horizon,
-        "risk_aversion": payload.risk_aversion.value,
-        "objectif": payload.objectif.value,
-        "profil": profil,
-        "risk_score": risk_score,
-        "classes_actifs": classes_actifs,
-        "recommendation": rag_response,
-        "portfolio_alloc": portfolio_alloc,  # allocations à 0% exclues
-        "user_portfolio": {
-            "risk": float(user_risk),
-            "ret": float(user_ret)
-        },
-        "sim_performance": sim_performance,
-        "frontier_points": frontier_points,
-        "user_point": user_point
+    return {**recommendation_pipeline.response(entry, points, downsample, encoding), "result_id": result_id}
+
+@app.get("/performance/{result_id}")
+def performance_page(
+    result_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(5000, ge=1, le=50000),
+    encoding: str = Query("json", pattern="^(json|base64)$"),
+):
+    # Série de performance en pleine résolution, par pages, depuis le résultat en cache
+    entry = recommendation_pipeline.get(result_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Résultat inconnu ou expiré, soumettez à nouveau le profil")
+    if isinstance(entry["performance"], dict):
+        raise HTTPException(status_code=500, detail=entry["performance"].get("error"))
+    return page(entry["performance"], offset, limit, encoding)
+
+@app.post("/submit_profiles/batch")
+def submit_profiles_batch(payloads: List[UserProfileIn]):
+    # Scoring vectorisé de tout le lot (import de questionnaires en masse)
+    with timed("classification"):
+        risk_scores, profils = classify_profiles_batch({
+            "age": [p.age for p in payloads],
+            "risk_aversion": [p.risk_aversion.value for p in payloads],
+            "horizon": [p.horizon for p in payloads],
+            "revenu": [p.revenu for p in payloads],
+            "objectif": [p.objectif.value for p in payloads],
+            "esg_preference": [p.esg_preference for p in payloads],
+        })
+
+    return [
+        {"email": payload.email, "profil": profil, "risk_score": float(risk_score)}
+        for payload, risk_score, profil in zip(payloads, risk_scores, profils)
+    ]
+
+@app.post("/projection")
+def projection(
+    payload: UserProfileIn,
+    method: str = Query("normal", pattern="^(normal|bootstrap)$"),
+    paths: int = Query(100_000, ge=1, le=MAX_PATHS),
+    seed: Optional[int] = Query(None, ge=0),
+    target: Optional[float] = Query(None, gt=0, description="Multiple du capital initial (défaut : selon l'objectif)"),
+    initial: float = Query(1.0, gt=0),
+    stream: bool = Query(False, description="NDJSON : percentiles partiels après chaque lot"),
+):
+    # Simulation Monte Carlo du portefeuille recommandé sur l'horizon de l'utilisateur
+    try:
+        _, entry = recommendation_pipeline.run(payload)
+        if method == "bootstrap":
+            model = bootstrap_model(market_data.prices(), entry["weights"])
+        else:
+            user_portfolio = entry["result"]["user_portfolio"]
+            model = normal_model(user_portfolio["ret"], user_portfolio["risk"])
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    options = {
+        "n_paths": paths,
+        "seed": seed,
+        "target": target if target is not None else default_target(payload.objectif.value, payload.horizon),
+        "initial": initial,
     }
-def generate_pdf_report(user_data):
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-
-    # Titre
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(50, height - 50, "Rapport d'Investissement - Robo-Advisor")
-
-    # Informations utilisateur
-    c.setFont("Helvetica", 12)
-    y_position = height - 80
-    c.drawString(50, y_position, f"Profil: {user_data['profil']}")
-    y_position -= 20
-    c.drawString(50, y_position, f"Score de risque: {user_data['risk_score']}")
-    y_position -= 20
-    c.drawString(50, y_position, f"Âge: {user_data['age']}")
-    y_position -= 20
-    c.drawString(50, y_position, f"Revenu: {user_data['revenu']} €")
-    y_position -= 20
-    c.drawString(50, y_position, f"Horizon: {user_data['horizon']} ans")
-    y_position -= 20
-    c.drawString(50, y_position, f"Aversion au risque: {user_data['risk_aversion']}")
-    y_position -= 20
-    c.drawString(50, y_position, f"Objectif: {user_data['objectif']}")
-    y_position -= 20
-    c.drawString(50, y_position, f"Préférence ESG: {'Oui' if user_data['esg_preference'] else 'Non'}")
-
-    # Allocation du portefeuille
-    y_position -= 30
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(50, y_position, "Allocation du portefeuille")
-    y_position -= 20
-    c.setFont("Helvetica", 12)
-    for asset, weight in user_data['portfolio_alloc'].items():
-        if weight > 0:
-            c.drawString(50, y_position, f"{asset}: {(weight * 100):.2f}%")
-            y_position -= 20
-
-    # Générer et ajouter le graphique en camembert
-    y_position -= 30
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(50, y_position, "Graphique d'allocation")
-    y_position -= 220
-
-    # Créer le graphique en camembert avec matplotlib
-    labels = [asset for asset, weight in user_data['portfolio_alloc'].items() if weight > 0]
-    sizes = [weight * 100 for weight in user_data['portfolio_alloc'].values() if weight > 0]
-    fig, ax = plt.subplots()
-    ax.pie(sizes, labels=labels, autopct='%1.1f%%')
-    plt.title("Allocation du portefeuille")
-    pie_chart_path = "pie_chart.png"
-    plt.savefig(pie_chart_path)
-    plt.close()
-
-    # Ajouter le graphique au PDF
-    c.drawImage(ImageReader(pie_chart_path), 50, y_position, width=3*inch, height=3*inch)
-    os.remove(pie_chart_path)  # Supprimer le fichier temporaire
-
-    # Ajouter la performance simulée (si disponible)
-    if user_data['sim_performance'] and not user_data['sim_performance'].get('error'):
-        y_position -= 250
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(50, y_position, "Performance simulée historique")
-        y_position -= 220
-
-        # Créer le graphique de performance
-        fig, ax = plt.subplots()
-        ax.plot(user_data['sim_performance']['dates'], user_data['sim_performance']['cumulative_returns'])
-        ax.set_title("Performance simulée (Rendement Cumulé)")
-        ax.set_xlabel("Date")
-        ax.set_ylabel("Rendement")
-        line_chart_path = "line_chart.png"
-        plt.savefig(line_chart_path)
-        plt.close()
-
-        # Ajouter au PDF
-        c.drawImage(ImageReader(line_chart_path), 50, y_position, width=3*inch, height=3*inch)
-        os.remove(line_chart_path)
-
-    # Ajouter la frontière efficiente (si disponible)
-    if user_data['frontier_points'] and len(user_data['frontier_points']) > 0:
-        y_position -= 250
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(50, y_position, "Frontière efficiente")
-        y_position -= 220
-
-        # Créer le graphique de la frontière
-        fig, ax = plt.subplots()
-        risks = [point['risk'] for point in user_data['frontier_points']]
-        returns = [point['return'] for point in user_data['frontier_points']]
-        ax.plot(risks, returns, label="Frontière efficiente")
-        ax.scatter([user_data['user_point']['risk']], [user_data['user_point']['return']], color='orange', label="Votre portefeuille")
-        ax.set_title("Frontière efficiente : Risque vs Rendement")
-        ax.set_xlabel("Risque (%)")
-        ax.set_ylabel("Rendement (%)")
-        ax.legend()
-        frontier_chart_path = "frontier_chart.png"
-        plt.savefig(frontier_chart_path)
-        plt.close()
-
-        # Ajouter au PDF
-        c.drawImage(ImageReader(frontier_chart_path), 50, y_position, width=3*inch, height=3*inch)
-        os.remove(frontier_chart_path)
-
-    # Recommandation
-    y_position -= 30
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(50, y_position, "Recommandation")
-    y_position -= 20
-    c.setFont("Helvetica", 12)
-    text = c.beginText(50, y_position)
-    for line in user_data['recommendation'].split('\n'):
-        text.textLine(line)
-    c.drawText(text)
-
-    c.showPage()
-    c.save()
-    buffer.seek(0)
-    return buffer
-@app.post("/generate_pdf")
-async def generate_pdf(payload: UserProfileIn, db: Session = Depends(get_db)):
-    # Réutiliser la logique de /submit_profile pour obtenir les données
-    risk_score, profil = classify_profile(
-        age=payload.age,
-        risk_aversion=payload.risk_aversion.value,
-        horizon=payload.horizon,
-        revenu=payload.revenu,
-        objectif=payload.objectif.value,
-        esg_preference=payload.esg_preference
-    )
-
-    portfolio_alloc = generate_initial_portfolio(profil)
-    prices = pd.read_csv("prices.csv", index_col=0, parse_dates=True)
-    prices = prices.dropna(axis=1, how="all")
-    prices = prices.loc[:, (prices != 0).any()]
-
-    if prices.empty:
-        raise HTTPException(status_code=500, detail="Aucun ticker valide trouvé dans les données de prix")
-
-    mu = expected_returns.mean_historical_return(prices)
-    S = risk_models.sample_cov(prices)
-    ef = EfficientFrontier(mu, S)
-
-    valid_weights = {t: w for t, w in portfolio_alloc.items() if t in prices.columns}
-    if not valid_weights:
-        raise HTTPException(status_code=500, detail="No overlap between portfolio_alloc and price data")
-
-    ef_weights = [valid_weights.get(t, 0) for t in ef.tickers]
-    ef.weights = np.array(ef_weights)
-    user_ret, user_risk, _ = ef.portfolio_performance()
-
-    sim_performance = {'error': 'Computation failed'}
-    frontier_points = []
+    if stream:
+        lines = (json.dumps(partial) + "\n" for partial in iter_projection(model, payload.horizon, **options))
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+    return {"method": method, **run_projection(model, payload.horizon, **options)}
+
+@app.post("/risk")
+def risk(
+    portfolios: List[Dict[str, float]],
+    confidence: float = Query(0.95, gt=0.5, lt=1),
+    horizon: int = Query(1, ge=1, le=252, description="Horizon de la VaR / CVaR en jours de bourse"),
+    window: int = Query(63, ge=2, le=2520, description="Fenêtre des séries glissantes"),
+    benchmark: Optional[str] = Query(None, description="Ticker de référence du bêta (défaut : univers équipondéré)"),
+    points: int = Query(250, ge=2, le=5000),
+):
+    # Indicateurs de risque d'un lot de portefeuilles, calculés en une passe sur les rendements en cache
+    if not portfolios:
+        raise HTTPException(status_code=422, detail="Aucun portefeuille fourni")
     try:
-        sim_performance = compute_historical_performance(prices, portfolio_alloc)
-        frontier_points = compute_efficient_frontier_points(prices)
-    except Exception as e:
-        print(f"Visualization computation error: {e}")
-
-    user_point = {'risk': float(user_risk), 'return': float(user_ret)}
-
-    user_db = User(
-        email=payload.email,
-        age=payload.age,
-        revenu=payload.revenu,
-        horizon=payload.horizon,
-        risk_aversion=payload.risk_aversion.value,
-        objectif=payload.objectif.value,
-        esg_preference=payload.esg_preference,
-        profil=profil,
-        risk_score=risk_score,
-    )
-    db.add(user_db)
-    db.commit()
-    db.refresh(user_db)
+        with timed("risk"):
+            metrics = risk_metrics(portfolios, confidence=confidence, horizon=horizon, window=window, benchmark=benchmark)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"portfolios": [risk_report(metrics, i, points) for i in range(len(portfolios))]}
+
+@app.get("/risk/{result_id}")
+def risk_of_result(
+    result_id: str,
+    confidence: float = Query(0.95, gt=0.5, lt=1),
+    horizon: int = Query(1, ge=1, le=252),
+    window: int = Query(63, ge=2, le=2520),
+    benchmark: Optional[str] = Query(None),
+    points: int = Query(250, ge=2, le=5000),
+):
+    # Indicateurs de risque du portefeuille recommandé, depuis le résultat en cache
+    entry = recommendation_pipeline.get(result_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Résultat inconnu ou expiré, soumettez à nouveau le profil")
+    return risk([entry["weights"]], confidence, horizon, window, benchmark, points)["portfolios"][0]
 
-    classes_actifs = get_assets_for_profile(profil)
-    rag_response = get_recommendation_for_profile(profil)
+@app.post("/generate_pdf")
+async def generate_pdf(payload: UserProfileIn):
+    # Calculs (ou résultat en cache) dans le pool de threads
+    try:
+        _, entry = await run_in_threadpool(recommendation_pipeline.run, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    _save_user(entry)
+    return await _pdf_response(entry)
+
+@app.get("/generate_pdf/{result_id}")
+async def generate_pdf_from_result(result_id: str):
+    # Rendu d'un résultat déjà affiché par /submit_profile, sans aucun recalcul
+    entry = recommendation_pipeline.get(result_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Résultat inconnu ou expiré, soumettez à nouveau le profil")
+    _save_user(entry)
+    return await _pdf_response(entry)
+
+def _save_user(entry: dict) -> None:
+    # Écriture différée : l'utilisateur est inséré par lots en arrière-plan, hors du chemin de la requête,
+    # au premier PDF d'un résultat (les téléchargements suivants ne le réinsèrent pas)
+    payload, result = entry["payload"], entry["result"]
+    # Sans email (facultatif dans le questionnaire), l'utilisateur ne peut pas être enregistré
+    if payload.email is None or not recommendation_pipeline.claim_user_save(entry):
+        return
+    try:
+        user_writer.submit({
+            "email": payload.email,
+            "age": payload.age,
+            "revenu": payload.revenu,
+            "horizon": payload.horizon,
+            "risk_aversion": payload.risk_aversion.value,
+            "objectif": payload.objectif.value,
+            "esg_preference": payload.esg_preference,
+            "profil": result["profil"],
+            "risk_score": result["risk_score"],
+        })
+    except asyncio.QueueFull:
+        recommendation_pipeline.release_user_save(entry)
+        raise HTTPException(status_code=503, detail="Service saturé, réessayez dans un instant")
+
+async def _pdf_response(entry: dict) -> StreamingResponse:
+    payload, result = entry["payload"], entry["result"]
 
     # Données pour le PDF
     user_data = {
-        "id": user_db.id,
-        "age": user_db.age,
-        "revenu": user_db.revenu,
-        "horizon": user_db.horizon,
-        "risk_aversion": user_db.risk_aversion,
-        "objectif": user_db.objectif,
-        "esg_preference": user_db.esg_preference,
-        "profil": user_db.profil,
-        "risk_score": user_db.risk_score,
-        "classes_actifs": classes_actifs,
-        "recommendation": rag_response,
-        "portfolio_alloc": portfolio_alloc,
-        "user_portfolio": {
-            "risk": float(user_risk),
-            "ret": float(user_ret)
-        },
-        "sim_performance": sim_performance,
-        "frontier_points": frontier_points,
-        "user_point": user_point
+        "age": payload.age,
+        "revenu": payload.revenu,
+        "horizon": payload.horizon,
+        "risk_aversion": payload.risk_aversion.value,
+        "objectif": payload.objectif.value,
+        "esg_preference": payload.esg_preference,
+        "profil": result["profil"],
+        "risk_score": result["risk_score"],
+        "classes_actifs": result["classes_actifs"],
+        "recommendation": result["recommendation"],
+        "portfolio_alloc": entry["weights"],
+        "user_portfolio": result["user_portfolio"],
+        # Courbe sous-échantillonnée (LTTB) : même rendu, tracé plus rapide
+        "sim_performance": performance_payload(entry["performance"], PDF_SERIES_POINTS),
+        "frontier_points": result["frontier_points"],
+        "user_point": result["user_point"],
+        "risk": await run_in_threadpool(_pdf_risk, entry["weights"]),
     }
-
-    # Générer le PDF
-    pdf_buffer = generate_pdf_report(user_data)
+    # Le contexte est copié pour que le rendu apparaisse dans le profil de la requête
+    context = contextvars.copy_context()
+    pdf_buffer = await asyncio.get_running_loop().run_in_executor(pdf_executor, context.run, _render_pdf, user_data)
 
     # Retourner le PDF comme réponse
     return StreamingResponse(
-        pdf_buffer,
+        iter_pdf(pdf_buffer),
         media_type="application/pdf",
         headers={"Content-Disposition": "attachment; filename=rapport_investissement.pdf"}
-    )
\ No newline at end of file
+    )
+
+def _pdf_risk(weights: dict) -> Optional[dict]:
+    # Section facultative : le PDF reste disponible si les indicateurs ne peuvent être calculés
+    try:
+        with timed("risk"):
+            return risk_report(risk_metrics(weights), points=PDF_SERIES_POINTS)
+    except ValueError as e:
+        logger.warning("Indicateurs de risque indisponibles pour le PDF: %s", e)
+        return None
+
+def _render_pdf(user_data: dict):
+    with timed("pdf_render"):
+        return generate_pdf_report(user_data)
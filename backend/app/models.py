@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, Enum
+from sqlalchemy import Column, Integer, String, Float, Boolean, Enum, DateTime, ForeignKey, JSON
 from database import Base
 
 class User(Base):
@@ -14,3 +14,18 @@ class User(Base):
     esg_preference = Column(Boolean, default=False)
     profil = Column(String, nullable=False)
     risk_score = Column(Float, nullable=False)
+
+
+class UserPortfolio(Base):
+    """Latest optimised portfolio of a user, rewritten by the re-optimisation job."""
+    __tablename__ = "user_portfolios"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    profil = Column(String, nullable=False)
+    constraints = Column(String, nullable=False, default="")  # per-user constraints on top of the profile (none yet)
+    weights = Column(JSON, nullable=False)
+    expected_return = Column(Float, nullable=False)
+    volatility = Column(Float, nullable=False)
+    sharpe = Column(Float, nullable=False)
+    data_version = Column(String, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from pypfopt import expected_returns, risk_models, EfficientFrontier
+from services.risk import risk_metrics, risk_report
 
 
 
@@ -34,6 +35,16 @@ print(f"Rendement annuel moyen : {mean_return:.2%}")
 print(f"Volatilité annuelle : {volatility:.2%}")
 print(f"Sharpe Ratio : {sharpe_ratio:.2f}")
 
+# Indicateurs de risque (mêmes calculs que l'endpoint /risk)
+risk = risk_report(risk_metrics(weights, returns))
+print(f"VaR historique 95% (1 jour) : {risk['historical_var']:.2%}")
+print(f"CVaR historique 95% (1 jour) : {risk['historical_cvar']:.2%}")
+print(f"VaR paramétrique 95% (1 jour) : {risk['parametric_var']:.2%}")
+print(f"Perte maximale : {risk['max_drawdown']:.2%} ({risk['max_drawdown_peak'] or 'début'} → {risk['max_drawdown_trough'] or 'début'}, "
+      f"{risk['max_drawdown_duration']} jours sous le plus haut)")
+for ticker, contribution in risk['risk_contributions'].items():
+    print(f"Contribution au risque {ticker} : {contribution['percent']:.2%}")
+
 
 cumulative_returns = (1 + portfolio_returns).cumprod()
 cumulative_returns.plot(title="Évolution du portefeuille", figsize=(12,6))
@@ -0,0 +1,26 @@
+import argparse
+import logging
+import os
+
+from sqlalchemy import create_engine
+
+from database import DATABASE_URL
+from services.reoptimization import PAGE_SIZE, reoptimize_all
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ré-optimisation des portefeuilles de tous les utilisateurs")
+    parser.add_argument("--database-url", default=DATABASE_URL, help="ex. sqlite:///robo-advisor.db")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processus de résolution (0 : aucun)")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--checkpoint", default="reoptimize.checkpoint.json", help="Reprise après interruption")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    engine = create_engine(args.database_url)
+    stats = reoptimize_all(engine, args.workers, args.page_size, args.checkpoint)
+    print(
+        f"{stats['users']} utilisateurs, {stats['problems']} problèmes distincts "
+        f"(résolution {stats['solve_seconds']:.2f}s), {stats['seconds']:.2f}s, "
+        f"{stats['users_per_sec']:.0f} utilisateurs/s"
+    )
@@ -0,0 +1,255 @@
+from typing import Mapping, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from services.market_data import market_data
+
+TRADING_DAYS = 252
+
+# Upper bound on the (portfolios x dates x assets) block simulated at once
+MAX_BLOCK_ELEMENTS = 20_000_000
+# Initial window (trading days) scanned for a drift breach after each rebalancing
+DRIFT_SCAN_DAYS = 64
+
+Schedule = Union[None, str, int]
+
+
+def weights_matrix(weights: Union[Mapping[str, float], Sequence[Mapping[str, float]]], tickers: Sequence[str]) -> np.ndarray:
+    """
+    Convert one weights dict, or a list of them, to a (P, N) matrix aligned on `tickers`.
+    Tickers missing from the universe are ignored.
+    """
+    if isinstance(weights, Mapping):
+        weights = [weights]
+    position = {ticker: i for i, ticker in enumerate(tickers)}
+    matrix = np.zeros((len(weights), len(tickers)))
+    for row, portfolio in enumerate(weights):
+        for ticker, weight in portfolio.items():
+            column = position.get(ticker)
+            if column is not None:
+                matrix[row, column] = weight
+    return matrix
+
+
+def rebalance_mask(dates: pd.DatetimeIndex, schedule: Schedule = None) -> np.ndarray:
+    """
+    Calendar rebalancing dates as a boolean mask over `dates` (the first date is always True).
+    schedule: None (buy and hold), "daily", a pandas period alias ("W", "M", "Q", "Y")
+    or an integer number of trading days between rebalances.
+    """
+    T = len(dates)
+    if schedule is None:
+        mask = np.zeros(T, dtype=bool)
+    elif schedule == "daily":
+        mask = np.ones(T, dtype=bool)
+    elif isinstance(schedule, (int, np.integer)):
+        mask = np.arange(T) % int(schedule) == 0
+    else:
+        periods = pd.DatetimeIndex(dates).to_period(schedule).asi8
+        mask = np.r_[True, periods[1:] != periods[:-1]]
+    if T:
+        mask[0] = True
+    return mask
+
+
+def _log_growth(returns: np.ndarray) -> np.ndarray:
+    """Cumulative log growth before each date: row t holds sum(log1p(r[:t]))."""
+    growth = np.zeros((returns.shape[0] + 1, returns.shape[1]))
+    np.cumsum(np.log1p(returns), axis=0, out=growth[1:])
+    return growth
+
+
+def drift_rebalance_mask(returns: np.ndarray, weights: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    Threshold-triggered rebalancing: a portfolio is reset to its target weights on the day
+    after any asset weight drifts more than `threshold` away from target.
+    Returns a (P, T) mask. The Python loop runs once per rebalancing event: drifted weights
+    of a segment come from the cumulative log growth (as in _simulate_block) and the first
+    breach is found with argmax. Segments are scanned in windows that grow geometrically
+    from the previous segment length, so the total cost stays O(T * N) per portfolio.
+    """
+    T = returns.shape[0]
+    weights = np.atleast_2d(weights)
+    growth = _log_growth(returns)
+    mask = np.zeros((weights.shape[0], T), dtype=bool)
+
+    for p, target in enumerate(weights):
+        cash = 1.0 - target.sum()
+        start, span = 0, DRIFT_SCAN_DAYS
+        while start < T:
+            mask[p, start] = True
+            scanned = start
+            while True:
+                # Drifted weights at the close of dates scanned..end-1 since the segment start
+                end = min(scanned + span, T)
+                asset_values = target * np.exp(growth[scanned + 1:end + 1] - growth[start])
+                drifted = asset_values / (asset_values.sum(axis=1, keepdims=True) + cash)
+                breached = np.abs(drifted - target).max(axis=1) > threshold
+                first = int(breached.argmax())
+                if breached[first] or end == T:
+                    break
+                scanned, span = end, 2 * span
+            if not breached[first]:
+                break
+            length = scanned + first + 1 - start
+            start += length
+            span = max(2 * length, DRIFT_SCAN_DAYS)
+    return mask
+
+
+def _simulate_block(growth: np.ndarray, weights: np.ndarray, mask: np.ndarray) -> dict:
+    """
+    Simulate a block of portfolios.
+    growth: (T + 1, N) cumulative log growth, weights: (P, N) or (P, T, N) targets,
+    mask: (P, T) rebalancing dates. Returns portfolio values and turnover.
+    """
+    P, T = mask.shape
+    dates = np.arange(T)
+
+    # Index of the last rebalancing date at or before each date
+    start = np.maximum.accumulate(np.where(mask, dates, 0), axis=1)
+
+    # Weights held since the segment start, and per-asset growth since then
+    if weights.ndim == 3:
+        held = np.take_along_axis(weights, start[:, :, None], axis=1)
+    else:
+        held = np.broadcast_to(weights[:, None, :], (P, T, weights.shape[-1]))
+    asset_growth = np.exp(growth[1:][None, :, :] - growth[start])
+    asset_values = held * asset_growth
+    cash = 1.0 - held.sum(axis=2)
+
+    # Value relative to the segment start; segments chain through their end values
+    segment_value = asset_values.sum(axis=2) + cash
+    closes_segment = np.zeros((P, T), dtype=bool)
+    closes_segment[:, :-1] = mask[:, 1:]
+    carried = np.cumprod(np.where(closes_segment, segment_value, 1.0), axis=1)
+    values = segment_value.copy()
+    values[:, 1:] *= carried[:, :-1]
+
+    # One-way turnover at each rebalancing: distance between drifted and new target weights
+    drifted = asset_values[:, :-1] / segment_value[:, :-1, None]
+    traded = 0.5 * np.abs(held[:, 1:] - drifted).sum(axis=2)
+    turnover = np.where(mask[:, 1:], traded, 0.0).sum(axis=1)
+
+    return {"values": values, "turnover": turnover}
+
+
+def summary_statistics(values: np.ndarray, risk_free_rate: float = 0.0, daily: Optional[np.ndarray] = None) -> dict:
+    """
+    Annualised return and volatility, Sharpe ratio and max drawdown of (P, T) value paths.
+    `daily` returns are derived from the values when not given.
+    """
+    values = np.atleast_2d(values)
+    T = values.shape[1]
+    if daily is None:
+        previous = np.concatenate([np.ones((values.shape[0], 1)), values[:, :-1]], axis=1)
+        daily = values / previous - 1
+
+    annual_return = values[:, -1] ** (TRADING_DAYS / T) - 1
+    annual_volatility = daily.std(axis=1, ddof=1) * np.sqrt(TRADING_DAYS)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = (daily.mean(axis=1) * TRADING_DAYS - risk_free_rate) / annual_volatility
+    max_drawdown = (values / np.maximum.accumulate(values, axis=1) - 1).min(axis=1)
+
+    return {
+        "annual_return": annual_return,
+        "annual_volatility": annual_volatility,
+        "sharpe": sharpe,
+        "max_drawdown": max_drawdown,
+    }
+
+
+def run_backtest(
+    weights: np.ndarray,
+    returns: Optional[pd.DataFrame] = None,
+    schedule: Schedule = None,
+    threshold: Optional[float] = None,
+    risk_free_rate: float = 0.0,
+    max_block_elements: int = MAX_BLOCK_ELEMENTS,
+) -> dict:
+    """
+    Backtest one or many portfolios over the (cached) daily returns matrix.
+    weights: (N,) or (P, N) target weights, or (P, T, N) targets per date (applied on
+             rebalancing dates). Weights summing to less than 1 hold cash.
+    schedule: calendar rebalancing (see rebalance_mask); threshold: drift-triggered
+              rebalancing instead, when set.
+    Portfolios are simulated in blocks bounded by `max_block_elements`.
+    Returns: {'dates', 'values' (P, T), 'turnover', 'annual_return', 'annual_volatility',
+              'sharpe', 'max_drawdown'} with one entry per portfolio.
+    """
+    if returns is None:
+        returns = market_data.returns()
+    matrix = returns.to_numpy(dtype=float)
+    T, N = matrix.shape
+
+    weights = np.asarray(weights, dtype=float)
+    if weights.ndim == 1:
+        weights = weights[None, :]
+    if weights.shape[-1] != N or (weights.ndim == 3 and weights.shape[1] != T):
+        raise ValueError(f"Weights of shape {weights.shape} do not match returns of shape {(T, N)}")
+
+    if threshold is not None:
+        if weights.ndim == 3:
+            raise ValueError("Drift-threshold rebalancing needs constant target weights")
+        mask = drift_rebalance_mask(matrix, weights, threshold)
+    else:
+        mask = np.broadcast_to(rebalance_mask(returns.index, schedule), (weights.shape[0], T))
+
+    growth = _log_growth(matrix)
+    block = max(1, max_block_elements // max(T * N, 1))
+    values, turnover = [], []
+    for first in range(0, weights.shape[0], block):
+        result = _simulate_block(growth, weights[first:first + block], mask[first:first + block])
+        values.append(result["values"])
+        turnover.append(result["turnover"])
+
+    values = np.concatenate(values)
+    return {
+        "dates": returns.index,
+        "values": values,
+        "turnover": np.concatenate(turnover),
+        **summary_statistics(values, risk_free_rate),
+    }
+
+
+def backtest_portfolios(
+    weights: np.ndarray,
+    returns: Optional[pd.DataFrame] = None,
+    paths: bool = False,
+    chunk_size: int = 4096,
+    dtype=np.float64,
+    risk_free_rate: float = 0.0,
+) -> dict:
+    """
+    Constant-mix (daily rebalanced) backtest of many portfolios at once.
+    Portfolio returns come from one (T x N) @ (N x P) product per chunk of `chunk_size`
+    portfolios, so memory stays bounded by T * chunk_size. dtype=np.float32 halves it.
+    weights: (P, N) matrix aligned on the returns columns (see weights_matrix).
+    Returns summary statistics per portfolio, plus (P, T) cumulative 'values' if `paths`.
+    """
+    if returns is None:
+        returns = market_data.returns()
+    matrix = returns.to_numpy(dtype=dtype)
+    weights = np.atleast_2d(np.asarray(weights, dtype=dtype))
+    if weights.shape[1] != matrix.shape[1]:
+        raise ValueError(f"Weights have {weights.shape[1]} assets, returns have {matrix.shape[1]}")
+
+    P, T = weights.shape[0], matrix.shape[0]
+    values_out = np.empty((P, T), dtype=dtype) if paths else None
+    statistics = {key: np.empty(P) for key in ("annual_return", "annual_volatility", "sharpe", "max_drawdown")}
+
+    for first in range(0, P, chunk_size):
+        last = min(first + chunk_size, P)
+        daily = weights[first:last] @ matrix.T
+        values = np.cumprod(1 + daily, axis=1)
+        for key, value in summary_statistics(values, risk_free_rate, daily=daily).items():
+            statistics[key][first:last] = value
+        if paths:
+            values_out[first:last] = values
+
+    result = {"dates": returns.index, **statistics}
+    if paths:
+        result["values"] = values_out
+    return result
+
@@ -0,0 +1,187 @@
+"""
+Columnar binary storage for date x ticker panels.
+
+A panel `<name>` in a directory is three files:
+    <name>.f64       float64 matrix, row-major (one row per date), appended in place
+    <name>.dates     int64 nanosecond timestamps, one per row
+    <name>.json      manifest: tickers, row count and a running version hash
+    <name>.derived.* state computed incrementally from the panel (e.g. running moments)
+
+New days are appended to the end of both binary files and the manifest is replaced
+atomically afterwards, so readers only ever see complete rows. Readers memory-map the
+matrix: opening a panel costs the same whatever its size. Rewriting a panel deletes its
+derived state, which is only valid while history is appended to.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+MARKET_DATA_DIR = os.getenv("MARKET_DATA_DIR", "market_data")
+
+
+class Panel(NamedTuple):
+    values: np.ndarray          # (T, N) read-only, memory-mapped
+    dates: pd.DatetimeIndex
+    tickers: pd.Index
+    version: str
+
+
+def _paths(directory: str, name: str):
+    base = os.path.join(directory, name)
+    return base + ".f64", base + ".dates", base + ".json"
+
+
+def manifest_path(directory: str = MARKET_DATA_DIR, name: str = "prices") -> str:
+    return _paths(directory, name)[2]
+
+
+def derived_path(directory: str, name: str, suffix: str) -> str:
+    """Path of state derived from panel `name`, deleted when the panel is rewritten."""
+    return os.path.join(directory, f"{name}.derived.{suffix}")
+
+
+def read_manifest(directory: str = MARKET_DATA_DIR, name: str = "prices") -> Optional[dict]:
+    try:
+        with open(manifest_path(directory, name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(path: str, manifest: dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def _chain_version(previous: str, values: np.ndarray, dates: np.ndarray) -> str:
+    """Version hash updated from the appended rows only."""
+    digest = hashlib.blake2b(previous.encode(), digest_size=16)
+    digest.update(values.tobytes())
+    digest.update(dates.tobytes())
+    return digest.hexdigest()
+
+
+def _frame_arrays(frame: pd.DataFrame):
+    values = np.ascontiguousarray(frame.to_numpy(dtype=np.float64))
+    dates = pd.DatetimeIndex(frame.index).as_unit("ns").asi8
+    return values, dates
+
+
+def write_panel(frame: pd.DataFrame, directory: str = MARKET_DATA_DIR, name: str = "prices") -> dict:
+    """Write a full panel, replacing any existing one."""
+    os.makedirs(directory, exist_ok=True)
+    values_path, dates_path, manifest = _paths(directory, name)
+    values, dates = _frame_arrays(frame)
+
+    # History is rewritten: state derived from the previous rows no longer applies
+    for path in glob.glob(glob.escape(derived_path(directory, name, "")) + "*"):
+        os.remove(path)
+
+    # New files replace the old ones atomically: existing memory maps keep the old inode
+    values.tofile(values_path + ".tmp")
+    dates.tofile(dates_path + ".tmp")
+    os.replace(values_path + ".tmp", values_path)
+    os.replace(dates_path + ".tmp", dates_path)
+    tickers = [str(t) for t in frame.columns]
+    content = {
+        "tickers": tickers,
+        "rows": int(values.shape[0]),
+        "dtype": "float64",
+        "version": _chain_version("\x1f".join(tickers), values, dates),
+    }
+    _write_manifest(manifest, content)
+    return content
+
+
+def append_panel(frame: pd.DataFrame, directory: str = MARKET_DATA_DIR, name: str = "prices") -> dict:
+    """
+    Append new dates to an existing panel without rewriting history.
+    The frame must have the stored tickers and only dates after the last stored one.
+    """
+    current = read_manifest(directory, name)
+    if current is None:
+        return write_panel(frame, directory, name)
+
+    tickers = [str(t) for t in frame.columns]
+    if tickers != current["tickers"]:
+        raise ValueError("Appended rows must have the stored tickers, in the same order")
+    if frame.empty:
+        return current
+
+    values_path, dates_path, manifest = _paths(directory, name)
+    values, dates = _frame_arrays(frame)
+    last = read_last_row(directory, name)
+    if last is not None and dates[0] <= last.index[0].value:
+        raise ValueError("Appended rows must be strictly after the last stored date")
+
+    # Truncate any partial write left by an interrupted append before adding rows
+    row_bytes = len(tickers) * 8
+    with open(values_path, "r+b") as f:
+        f.truncate(current["rows"] * row_bytes)
+        f.seek(0, os.SEEK_END)
+        f.write(values.tobytes())
+    with open(dates_path, "r+b") as f:
+        f.truncate(current["rows"] * 8)
+        f.seek(0, os.SEEK_END)
+        f.write(dates.tobytes())
+
+    content = dict(current)
+    content["rows"] = current["rows"] + int(values.shape[0])
+    content["version"] = _chain_version(current["version"], values, dates)
+    _write_manifest(manifest, content)
+    return content
+
+
+def open_panel(directory: str = MARKET_DATA_DIR, name: str = "prices") -> Panel:
+    """Memory-map a stored panel (no parsing, no copy)."""
+    content = read_manifest(directory, name)
+    if content is None:
+        raise FileNotFoundError(manifest_path(directory, name))
+
+    values_path, dates_path, _ = _paths(directory, name)
+    T, N = content["rows"], len(content["tickers"])
+    if T == 0:
+        values = np.empty((0, N))
+        dates = np.empty(0, dtype=np.int64)
+    else:
+        values = np.memmap(values_path, dtype=np.float64, mode="r", shape=(T, N))
+        dates = np.fromfile(dates_path, dtype=np.int64, count=T)
+    return Panel(values, pd.DatetimeIndex(dates.view("datetime64[ns]")), pd.Index(content["tickers"]), content["version"])
+
+
+def read_last_row(directory: str = MARKET_DATA_DIR, name: str = "prices") -> Optional[pd.DataFrame]:
+    """Last stored row as a one-row frame (None if the panel is missing or empty), read in O(1)."""
+    content = read_manifest(directory, name)
+    if content is None or not content["rows"]:
+        return None
+    values_path, dates_path, _ = _paths(directory, name)
+    T, N = content["rows"], len(content["tickers"])
+    values = np.fromfile(values_path, dtype=np.float64, count=N, offset=(T - 1) * N * 8)
+    dates = np.fromfile(dates_path, dtype=np.int64, count=1, offset=(T - 1) * 8)
+    return pd.DataFrame(values[None, :], index=pd.DatetimeIndex(dates.view("datetime64[ns]")), columns=content["tickers"])
+
+
+def read_frame(directory: str = MARKET_DATA_DIR, name: str = "prices") -> pd.DataFrame:
+    panel = open_panel(directory, name)
+    return pd.DataFrame(panel.values, index=panel.dates, columns=panel.tickers, copy=False)
+
+
+if __name__ == "__main__":
+    # Conversion des CSV existants : python -m services.columnar prices.csv returns.csv
+    parser = argparse.ArgumentParser(description="Convert date x ticker CSV files to the columnar format")
+    parser.add_argument("csv", nargs="+")
+    parser.add_argument("--dir", default=MARKET_DATA_DIR)
+    args = parser.parse_args()
+
+    for path in args.csv:
+        name = os.path.splitext(os.path.basename(path))[0]
+        content = write_panel(pd.read_csv(path, index_col=0, parse_dates=True), args.dir, name)
+        print(f"{path} -> {args.dir}/{name}.* ({content['rows']} rows, {len(content['tickers'])} tickers)")
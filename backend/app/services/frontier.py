@@ -0,0 +1,189 @@
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.large_universe import LowRankCovariance, is_large_universe, optimize_low_rank
+from services.market_data import market_data
+from services.metrics import cache_lookup, record_solve, timed
+from services.moments import dataset_version, get_low_rank_moments, get_moments
+from services.solver_service import frontier_task, solver_service
+
+logger = logging.getLogger(__name__)
+
+# Default volatility range used when the anchor portfolios cannot be solved
+DEFAULT_MIN_VOL = 0.05
+DEFAULT_MAX_VOL = 0.30
+
+
+class FrontierSweep:
+    """
+    Parameterised mean-variance problem: min w'Sw s.t. mu'w >= target, sum(w) = 1, 0 <= w <= 1.
+    The problem is canonicalised once; each point only updates the target
+    parameter and warm-starts the QP solver from the previous solution.
+    S is either a dense covariance or a LowRankCovariance (large universes).
+    """
+
+    def __init__(self, mu: pd.Series, S):
+        import cvxpy as cp
+
+        self.mu = np.asarray(mu, dtype=float)
+        if isinstance(S, LowRankCovariance):
+            # OSQP stalls on wide factor blocks; the interior-point solver needs no warm start
+            self.cov = S
+            self.solver = cp.CLARABEL
+        else:
+            self.solver = cp.OSQP
+            # S = F F', so the risk term stays a sum of squares the QP solver can warm-start
+            eigvals, eigvecs = np.linalg.eigh(np.asarray(S, dtype=float))
+            self.cov = LowRankCovariance(eigvecs * np.sqrt(np.clip(eigvals, 0.0, None)), np.zeros(len(self.mu)))
+
+        self.weights = cp.Variable(len(self.mu))
+        self.target_return = cp.Parameter()
+        risk = cp.sum_squares(self.cov.factors.T @ self.weights)
+        if self.cov.diag.any():
+            risk = risk + cp.sum_squares(cp.multiply(np.sqrt(self.cov.diag), self.weights))
+        self.problem = cp.Problem(
+            cp.Minimize(risk),
+            [
+                cp.sum(self.weights) == 1,
+                self.weights >= 0,
+                self.weights <= 1,
+                self.mu @ self.weights >= self.target_return,
+            ],
+        )
+
+    def solve(self, target_return: float) -> Optional[Tuple[float, float]]:
+        """Returns (risk, return) of the frontier portfolio, or None if infeasible."""
+        import cvxpy as cp
+
+        self.target_return.value = target_return
+        try:
+            with timed("solver"):
+                self.problem.solve(solver=self.solver, warm_start=True)
+        except cp.SolverError:
+            return None
+        record_solve("frontier_point", self.problem)
+        if self.problem.status not in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE):
+            return None
+
+        w = self.weights.value
+        return float(np.sqrt(max(self.cov.variance(w), 0.0))), float(self.mu @ w)
+
+    def sweep(self, targets: np.ndarray) -> List[Dict[str, float]]:
+        points = []
+        for target in targets:
+            solved = self.solve(float(target))
+            if solved is not None:
+                points.append({'risk': solved[0], 'return': solved[1]})
+        return points
+
+
+def _return_range(mu: pd.Series, S: pd.DataFrame) -> Tuple[float, float]:
+    """
+    Expected returns of the two ends of the plotted frontier: the minimum-volatility
+    portfolio and the efficient portfolio at 1.1x max(max-Sharpe volatility, 30%).
+    """
+    from pypfopt import EfficientFrontier
+
+    try:
+        ef_min = EfficientFrontier(mu, S)
+        with timed("solver"):
+            ef_min.min_volatility()
+        record_solve("frontier_min_volatility", ef_min._opt)
+        low, _, _ = ef_min.portfolio_performance()
+
+        ef_max = EfficientFrontier(mu, S)
+        with timed("solver"):
+            ef_max.max_sharpe()
+        record_solve("frontier_max_sharpe", ef_max._opt)
+        _, max_vol, _ = ef_max.portfolio_performance()
+        max_vol = max(float(max_vol), DEFAULT_MAX_VOL)
+
+        ef_top = EfficientFrontier(mu, S)
+        with timed("solver"):
+            ef_top.efficient_risk(max_vol * 1.1)
+        record_solve("frontier_efficient_risk", ef_top._opt)
+        high, _, _ = ef_top.portfolio_performance()
+        return float(low), float(high)
+    except Exception as e:
+        logger.warning("Failed to compute frontier bounds (%s), using full return range", e)
+        return float(np.min(mu)), float(np.max(mu))
+
+
+def _low_rank_return_range(mu: pd.Series, S: LowRankCovariance) -> Tuple[float, float]:
+    """_return_range on a low-rank covariance."""
+    def solve(objective, target_volatility=None) -> np.ndarray:
+        return np.array(list(optimize_low_rank(mu, S, objective, target_volatility).values()))
+
+    try:
+        expected = np.asarray(mu, dtype=float)
+        low = float(expected @ solve("min_volatility"))
+        max_vol = max(float(np.sqrt(S.variance(solve("max_sharpe")))), DEFAULT_MAX_VOL)
+        high = float(expected @ solve("efficient_risk", max_vol * 1.1))
+        return low, high
+    except Exception as e:
+        logger.warning("Failed to compute frontier bounds (%s), using full return range", e)
+        return float(np.min(mu)), float(np.max(mu))
+
+
+def build_sweep(mu: pd.Series, S) -> Tuple[FrontierSweep, Tuple[float, float]]:
+    """Canonicalised frontier problem and the return range it is swept over."""
+    if isinstance(S, LowRankCovariance):
+        return FrontierSweep(mu, S), _low_rank_return_range(mu, S)
+    return FrontierSweep(mu, S), _return_range(mu, S)
+
+
+class FrontierCache:
+    """Efficient-frontier curves memoised per price-data version and point count."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._sweep: Optional[Tuple[FrontierSweep, Tuple[float, float]]] = None
+        self._moments_ref = None  # solver-service handle on the moments of this version
+        self._curves: Dict[int, List[Dict[str, float]]] = {}
+
+    def invalidate(self, *_) -> None:
+        with self._lock:
+            self._version = None
+            self._sweep = None
+            self._moments_ref = None
+            self._curves = {}
+
+    def get_points(self, prices: Optional[pd.DataFrame] = None, num_points: int = 20) -> List[Dict[str, float]]:
+        if prices is None:
+            prices = market_data.prices()
+        version = dataset_version(prices)
+
+        with self._lock, timed("frontier"):
+            if self._version != version:
+                if is_large_universe(prices.shape[1], len(prices) - 1):
+                    mu, S = get_low_rank_moments(prices)
+                else:
+                    mu, S = get_moments(prices)
+                if solver_service.enabled:
+                    # Swept in the solver pool; workers keep the canonicalised problem per version
+                    self._moments_ref = solver_service.publish(version, mu, S)
+                else:
+                    self._sweep = build_sweep(mu, S)
+                self._curves = {}
+                self._version = version
+
+            points = self._curves.get(num_points)
+            cache_lookup("frontier", points is not None)
+            if points is None:
+                if self._moments_ref is not None:
+                    points = solver_service.run(frontier_task, self._moments_ref, num_points)
+                else:
+                    sweep, (low, high) = self._sweep
+                    points = sweep.sweep(np.linspace(low, high, num_points))
+                self._curves[num_points] = points
+                logger.debug("Generated %d frontier points", len(points))
+            return points
+
+
+frontier_cache = FrontierCache()
+market_data.add_listener(frontier_cache.invalidate)
@@ -0,0 +1,102 @@
+from abc import ABC, abstractmethod
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from services.columnar import MARKET_DATA_DIR, append_panel, read_last_row, read_manifest, write_panel
+
+
+class PriceProvider(ABC):
+    """Source of daily adjusted close prices."""
+
+    @abstractmethod
+    def fetch(self, tickers: Sequence[str], start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        """Date x ticker close prices for start <= date < end."""
+
+
+class YahooProvider(PriceProvider):
+    def fetch(self, tickers, start, end):
+        import yfinance as yf
+
+        data = yf.download(list(tickers), start=start, end=end, group_by='ticker', auto_adjust=True)
+        if data.empty:
+            return pd.DataFrame(columns=list(tickers), dtype=float)
+        return pd.DataFrame({ticker: data[ticker]['Close'] for ticker in tickers})
+
+
+class CSVProvider(PriceProvider):
+    """Local stand-in for Yahoo (tests, offline runs): serves slices of a date x ticker CSV."""
+
+    def __init__(self, path: str):
+        self.prices = pd.read_csv(path, index_col=0, parse_dates=True)
+
+    def fetch(self, tickers, start, end):
+        window = self.prices.loc[(self.prices.index >= start) & (self.prices.index < end)]
+        return window.reindex(columns=list(tickers))
+
+
+def validate_prices(prices: pd.DataFrame) -> pd.DataFrame:
+    """Sorted unique dates, complete rows only, strictly positive finite prices."""
+    prices = prices[~prices.index.duplicated(keep="last")].sort_index()
+    prices = prices.dropna()
+    values = prices.to_numpy(dtype=float)
+    if not np.isfinite(values).all() or (values <= 0).any():
+        raise ValueError("Fetched prices contain non-positive or non-finite values")
+    return prices
+
+
+def _append_csv(frame: pd.DataFrame, path: str) -> None:
+    frame.to_csv(path, mode="a", header=False)
+
+
+def ingest(
+    provider: PriceProvider,
+    tickers: Sequence[str],
+    start: str,
+    end: Optional[str] = None,
+    directory: str = MARKET_DATA_DIR,
+    prices_csv: Optional[str] = "prices.csv",
+    returns_csv: Optional[str] = "returns.csv",
+    full: bool = False,
+) -> dict:
+    """
+    Bring the stored panel up to `end` (default: today).
+    Only the range after the last stored date (read in O(1) from the end of the panel)
+    is fetched; the new rows are validated, appended to the price panel and their
+    returns appended to the returns panel (and to the CSV files, without rewriting them).
+    A full download happens on first run, with `full`, or when the ticker list changes.
+    """
+    tickers = list(tickers)
+    end = pd.Timestamp(end) if end is not None else pd.Timestamp.today().normalize()
+    manifest = read_manifest(directory)
+
+    if full or manifest is None or manifest["tickers"] != tickers:
+        prices = validate_prices(provider.fetch(tickers, pd.Timestamp(start), end))
+        returns = prices.pct_change().dropna()
+        write_panel(prices, directory, "prices")
+        write_panel(returns, directory, "returns")
+        if prices_csv:
+            prices.to_csv(prices_csv)
+        if returns_csv:
+            returns.to_csv(returns_csv)
+        return {"mode": "full", "rows": len(prices)}
+
+    # Stored rows are complete (validate_prices), so every ticker ends on the panel's last date
+    previous = read_last_row(directory)
+    panel_end = previous.index[0] if previous is not None else pd.Timestamp(start) - pd.Timedelta(days=1)
+    new_prices = provider.fetch(tickers, panel_end + pd.Timedelta(days=1), end).reindex(columns=tickers)
+    new_prices = validate_prices(new_prices.loc[new_prices.index > panel_end])
+    if new_prices.empty:
+        return {"mode": "incremental", "rows": 0}
+
+    # Returns of the new rows only: they need the last stored price row as reference
+    new_returns = pd.concat([previous, new_prices]).pct_change().iloc[1:]
+
+    append_panel(new_prices, directory, "prices")
+    append_panel(new_returns, directory, "returns")
+    if prices_csv:
+        _append_csv(new_prices, prices_csv)
+    if returns_csv:
+        _append_csv(new_returns, returns_csv)
+    return {"mode": "incremental", "rows": len(new_prices)}
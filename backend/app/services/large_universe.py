@@ -0,0 +1,217 @@
+"""
+Optimiser backend for large universes (thousands of assets, possibly N > T).
+
+The covariance is kept as low rank plus diagonal, S = F F' + diag(d), from Ledoit-Wolf
+shrinkage or a PCA factor model; the optimisation problems only use F'w and d * w, so
+memory and solve time grow with N * K instead of N^2.
+"""
+import os
+from collections import OrderedDict
+from typing import Dict, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.metrics import record_solve, timed
+
+# Universes from this many assets (or with fewer observations than assets) use this backend
+LARGE_UNIVERSE_MIN_ASSETS = int(os.getenv("LARGE_UNIVERSE_MIN_ASSETS", "250"))
+# Cardinality limit of the large-universe portfolios (0: no limit)
+LARGE_UNIVERSE_MAX_ASSETS = int(os.getenv("LARGE_UNIVERSE_MAX_ASSETS", "50"))
+# Rank kept in the factor part of the shrunk covariance; the solve time grows quickly with it
+LOW_RANK_MAX_FACTORS = int(os.getenv("LOW_RANK_MAX_FACTORS", "50"))
+
+# Group constraint: {name: (asset indices, lower bound, upper bound)}
+GroupBounds = Dict[str, Tuple[Sequence[int], float, float]]
+
+
+class LowRankCovariance(NamedTuple):
+    """Annualised covariance in factor form S = F F' + diag(d), never materialised as N x N."""
+    factors: np.ndarray   # (N, K)
+    diag: np.ndarray      # (N,)
+
+    def variance(self, weights: np.ndarray) -> float:
+        exposure = self.factors.T @ weights
+        return float(exposure @ exposure + self.diag @ (weights * weights))
+
+    def matvec(self, weights: np.ndarray) -> np.ndarray:
+        """S @ w in O(N * K)."""
+        return self.factors @ (self.factors.T @ weights) + self.diag * weights
+
+
+def is_large_universe(n_assets: int, n_observations: int) -> bool:
+    return n_assets >= LARGE_UNIVERSE_MIN_ASSETS or n_assets >= n_observations
+
+
+def group_bounds(
+    tickers: Sequence[str],
+    asset_classes: Mapping[str, Sequence[str]],
+    allocations: Mapping[str, float],
+    tolerance: float = 0.10,
+) -> GroupBounds:
+    """
+    Bounds on the weight of each asset class: its target allocation +/- tolerance.
+    Classes without any asset in the universe are skipped; assets outside every class are free.
+    """
+    position = {str(t): i for i, t in enumerate(tickers)}
+    groups = {}
+    for name, members in asset_classes.items():
+        idx = [position[t] for t in members if t in position]
+        if idx and name in allocations:
+            target = allocations[name]
+            groups[name] = (idx, max(target - tolerance, 0.0), min(target + tolerance, 1.0))
+    return groups
+
+
+def low_rank_performance(
+    weights: Mapping[str, float], mu: pd.Series, cov: LowRankCovariance, risk_free_rate: float = 0.0
+) -> Tuple[float, float, float]:
+    """(expected return, volatility, Sharpe ratio), as pypfopt's portfolio_performance."""
+    w = np.array([weights.get(t, 0.0) for t in mu.index], dtype=float)
+    ret = float(np.asarray(mu, dtype=float) @ w)
+    vol = float(np.sqrt(max(cov.variance(w), 0.0)))
+    return ret, vol, (ret - risk_free_rate) / vol
+
+
+def historical_mean_returns(returns: np.ndarray, frequency: int = 252) -> np.ndarray:
+    """Compounded annual return per asset, as pypfopt's mean_historical_return, in O(T * N)."""
+    return np.expm1(np.log1p(returns).sum(axis=0) * (frequency / returns.shape[0]))
+
+
+def _compress(centered: np.ndarray, scale: float, max_factors: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Factors F and diagonal r with F F' + diag(r) ~ scale * X'X: the top `max_factors`
+    principal components, the variance of the dropped ones folded into r so that
+    asset variances stay exact.
+    """
+    _, singular, vt = np.linalg.svd(centered, full_matrices=False)
+    factors = vt.T * (singular * np.sqrt(scale))
+    dropped = factors[:, max_factors:] if max_factors is not None else factors[:, :0]
+    return factors[:, :factors.shape[1] - dropped.shape[1]], (dropped ** 2).sum(axis=1)
+
+
+def ledoit_wolf_low_rank(
+    returns: np.ndarray, frequency: int = 252, max_factors: Optional[int] = LOW_RANK_MAX_FACTORS
+) -> LowRankCovariance:
+    """
+    Ledoit-Wolf shrinkage towards a scaled identity (same estimator as sklearn's
+    ledoit_wolf / pypfopt's CovarianceShrinkage.ledoit_wolf), in low-rank plus diagonal form:
+    (1 - delta) X'X / T + delta * mu * I. The shrinkage intensity only needs the T x T
+    Gram matrix, so the cost is O(T^2 * N) and memory O(T * N). Well defined when N > T.
+    The sample part is truncated to `max_factors` components (None: exact, rank min(T, N)).
+    """
+    T, N = returns.shape
+    centered = returns - returns.mean(axis=0)
+    squared = centered ** 2
+
+    # ||X'X||_F = ||XX'||_F and sum((X^2)'X^2) = sum of squared row norms: no N x N product
+    target = squared.sum() / (T * N)
+    gram = centered @ centered.T
+    cross = np.sum(gram ** 2) / T ** 2
+    beta = (np.sum(squared.sum(axis=1) ** 2) / T - cross) / (N * T)
+    delta = (cross - 2 * target * squared.sum() / T + N * target ** 2) / N
+    beta = min(beta, delta)
+    shrinkage = 0.0 if beta == 0 else beta / delta
+
+    factors, residual = _compress(centered, (1 - shrinkage) / T * frequency, max_factors)
+    return LowRankCovariance(factors, residual + shrinkage * target * frequency)
+
+
+def factor_model_low_rank(returns: np.ndarray, n_factors: int = 10, frequency: int = 252) -> LowRankCovariance:
+    """Statistical (PCA) factor model: top `n_factors` principal components plus idiosyncratic variance."""
+    T, N = returns.shape
+    centered = returns - returns.mean(axis=0)
+    _, singular, vt = np.linalg.svd(centered, full_matrices=False)
+    k = min(n_factors, len(singular))
+    loadings = vt[:k].T * (singular[:k] / np.sqrt(T - 1))
+    residual = (centered ** 2).sum(axis=0) / (T - 1) - (loadings ** 2).sum(axis=1)
+    return LowRankCovariance(loadings * np.sqrt(frequency), np.clip(residual, 1e-12, None) * frequency)
+
+
+def _risk(cov: LowRankCovariance, weights):
+    import cvxpy as cp
+
+    # Both terms are sums of squares of affine maps of w: a sparse QP / SOCP
+    return cp.sum_squares(cov.factors.T @ weights) + cp.sum_squares(cp.multiply(np.sqrt(cov.diag), weights))
+
+
+def _solve(
+    mu: np.ndarray,
+    cov: LowRankCovariance,
+    objective: str,
+    target_volatility: Optional[float],
+    groups: GroupBounds,
+    excluded: np.ndarray,
+    risk_free_rate: float,
+) -> np.ndarray:
+    import cvxpy as cp
+
+    n = len(mu)
+    w = cp.Variable(n)
+
+    if objective == "max_sharpe":
+        # Homogenised problem: min z'Sz s.t. (mu - rf)'z = 1, w = z / kappa
+        if np.all(mu[~excluded] <= risk_free_rate):
+            raise ValueError("max_sharpe needs at least one asset with return above the risk-free rate")
+        kappa = cp.Variable(nonneg=True)
+        constraints = [(mu - risk_free_rate) @ w == 1, cp.sum(w) == kappa, w >= 0, w <= kappa]
+        constraints += [cp.sum(w[list(idx)]) >= low * kappa for idx, low, _ in groups.values()]
+        constraints += [cp.sum(w[list(idx)]) <= high * kappa for idx, _, high in groups.values()]
+        if excluded.any():
+            constraints.append(w[np.flatnonzero(excluded)] == 0)
+        problem = cp.Problem(cp.Minimize(_risk(cov, w)), constraints)
+    else:
+        constraints = [cp.sum(w) == 1, w >= 0, w <= 1]
+        constraints += [cp.sum(w[list(idx)]) >= low for idx, low, _ in groups.values()]
+        constraints += [cp.sum(w[list(idx)]) <= high for idx, _, high in groups.values()]
+        if excluded.any():
+            constraints.append(w[np.flatnonzero(excluded)] == 0)
+        if objective == "efficient_risk":
+            constraints.append(_risk(cov, w) <= target_volatility ** 2)
+            problem = cp.Problem(cp.Maximize(mu @ w), constraints)
+        else:
+            problem = cp.Problem(cp.Minimize(_risk(cov, w)), constraints)
+
+    # Interior point: robust on the badly scaled homogenised max-Sharpe problem
+    with timed("solver"):
+        problem.solve(solver=cp.CLARABEL)
+    record_solve(f"large_{objective}", problem)
+    if problem.status not in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE):
+        raise ValueError(f"Large-universe optimisation failed: {problem.status}")
+
+    weights = np.asarray(w.value, dtype=float)
+    if objective == "max_sharpe":
+        weights = weights / kappa.value
+    return weights
+
+
+def optimize_low_rank(
+    mu: pd.Series,
+    cov: LowRankCovariance,
+    objective: str = "max_sharpe",
+    target_volatility: Optional[float] = None,
+    groups: Optional[GroupBounds] = None,
+    max_assets: Optional[int] = None,
+    risk_free_rate: float = 0.0,
+) -> "OrderedDict[str, float]":
+    """
+    Long-only mean-variance optimisation on a low-rank covariance.
+    objective: "max_sharpe", "efficient_risk" (needs target_volatility) or "min_volatility".
+    groups: bounds on the total weight of asset groups (see group_bounds).
+    max_assets: cardinality limit, enforced by solving the relaxed problem, keeping the
+    `max_assets` largest weights and re-solving on that support (no MIQP solver needed).
+    Returns cleaned weights like EfficientFrontier.clean_weights().
+    """
+    expected = np.asarray(mu, dtype=float)
+    groups = groups or {}
+    excluded = np.zeros(len(expected), dtype=bool)
+
+    weights = _solve(expected, cov, objective, target_volatility, groups, excluded, risk_free_rate)
+    if max_assets is not None and np.count_nonzero(weights > 1e-4) > max_assets:
+        excluded[np.argsort(weights)[:-max_assets]] = True
+        weights = _solve(expected, cov, objective, target_volatility, groups, excluded, risk_free_rate)
+
+    # Same cleaning as pypfopt: drop weights below 1e-4 and round to 5 decimals
+    weights[np.abs(weights) < 1e-4] = 0
+    weights = np.round(weights, 5)
+    return OrderedDict(zip(mu.index, weights.tolist()))
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import threading
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.columnar import MARKET_DATA_DIR, manifest_path, open_panel
+from services.metrics import timed
+
+PRICES_PATH = os.getenv("PRICES_PATH", "prices.csv")
+
+
+class MarketSnapshot(NamedTuple):
+    """Immutable view of one version of the price panel."""
+    values: np.ndarray          # (T, N) float64, read-only
+    dates: pd.DatetimeIndex     # T dates
+    tickers: pd.Index           # N cleaned tickers
+    version: str                # content hash of the panel
+
+
+class MarketDataStore:
+    """
+    Process-wide store for the price panel.
+    The columnar panel written by data_loader is memory-mapped when present;
+    otherwise prices.csv is parsed once. Either way the panel is cleaned once
+    (all-NaN and all-zero columns dropped) and kept as a read-only float64 matrix.
+    It is reloaded when the source file's mtime changes.
+    """
+
+    def __init__(self, path: str = PRICES_PATH, columnar_dir: str = MARKET_DATA_DIR):
+        self.path = path
+        self.columnar_dir = columnar_dir
+        self._lock = threading.Lock()
+        self._mtime: Optional[Tuple[str, float]] = None
+        self._snapshot: Optional[MarketSnapshot] = None
+        self._frame: Optional[pd.DataFrame] = None
+        self._returns: Optional[pd.DataFrame] = None
+        self._listeners: List[Callable[[MarketSnapshot], None]] = []
+
+    def add_listener(self, callback: Callable[[MarketSnapshot], None]) -> None:
+        """Register a callback invoked with the new snapshot after each reload."""
+        self._listeners.append(callback)
+
+    def _source(self) -> str:
+        """The columnar panel written by data_loader when present, else the CSV file."""
+        manifest = manifest_path(self.columnar_dir)
+        return manifest if os.path.exists(manifest) else self.path
+
+    def _read_csv(self) -> MarketSnapshot:
+        prices = pd.read_csv(self.path, index_col=0, parse_dates=True)
+        prices = prices.dropna(axis=1, how="all")
+        prices = prices.loc[:, (prices != 0).any()]
+
+        values = np.ascontiguousarray(prices.to_numpy(dtype=np.float64))
+        values.setflags(write=False)
+        dates = pd.DatetimeIndex(prices.index)
+        tickers = pd.Index(prices.columns)
+
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(values.tobytes())
+        digest.update(dates.asi8.tobytes())
+        digest.update("\x1f".join(map(str, tickers)).encode())
+        return MarketSnapshot(values, dates, tickers, digest.hexdigest())
+
+    def _read_columnar(self) -> MarketSnapshot:
+        panel = open_panel(self.columnar_dir)
+        values = panel.values
+        # Same cleaning as the CSV path; the memory map is only copied if a column is dropped
+        keep = ~np.isnan(values).all(axis=0) & (values != 0).any(axis=0)
+        if not keep.all():
+            values = np.ascontiguousarray(values[:, keep])
+            values.setflags(write=False)
+        return MarketSnapshot(values, panel.dates, panel.tickers[keep], panel.version)
+
+    def _read(self, source: str) -> MarketSnapshot:
+        return self._read_csv() if source == self.path else self._read_columnar()
+
+    def refresh(self) -> bool:
+        """Reload the panel if the file changed on disk. Returns True on reload."""
+        source = self._source()
+        mtime = (source, os.stat(source).st_mtime)
+        if mtime == self._mtime and self._snapshot is not None:
+            return False
+
+        with self._lock:
+            if mtime == self._mtime and self._snapshot is not None:
+                return False
+            with timed("data_load"):
+                snapshot = self._read(source)
+            self._snapshot = snapshot
+            self._frame = None
+            self._returns = None
+            self._mtime = mtime
+
+        for callback in self._listeners:
+            callback(snapshot)
+        return True
+
+    def snapshot(self) -> MarketSnapshot:
+        self.refresh()
+        return self._snapshot
+
+    @property
+    def version(self) -> str:
+        return self.snapshot().version
+
+    def prices(self) -> pd.DataFrame:
+        """
+        Cleaned price panel as a DataFrame backed by the shared read-only matrix.
+        No data is copied; callers must not modify it in place.
+        """
+        snapshot = self.snapshot()
+        frame = self._frame
+        if frame is None or frame.attrs.get("version") != snapshot.version:
+            frame = pd.DataFrame(snapshot.values, index=snapshot.dates, columns=snapshot.tickers, copy=False)
+            frame.attrs["version"] = snapshot.version
+            self._frame = frame
+        return frame
+
+    def returns(self) -> pd.DataFrame:
+        """
+        Daily simple returns of the cleaned panel (first date dropped), computed once
+        per version and backed by a read-only matrix shared by every caller.
+        """
+        snapshot = self.snapshot()
+        frame = self._returns
+        if frame is None or frame.attrs.get("version") != snapshot.version:
+            values = snapshot.values[1:] / snapshot.values[:-1] - 1.0
+            values.setflags(write=False)
+            frame = pd.DataFrame(values, index=snapshot.dates[1:], columns=snapshot.tickers, copy=False)
+            frame.attrs["version"] = snapshot.version
+            self._returns = frame
+        return frame
+
+
+market_data = MarketDataStore()
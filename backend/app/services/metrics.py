@@ -0,0 +1,275 @@
+"""
+Hot-path instrumentation: stage timers, cache hit/miss counters and solver statistics,
+exposed in the Prometheus text format by GET /metrics.
+
+Requests can also be profiled individually (X-Profile header when PROFILE_HEADER_ENABLED=1,
+or a random sample of PROFILE_SAMPLE_RATE): their stage timings are returned in a Server-Timing header and a
+cProfile summary of the stages is logged.
+"""
+import contextvars
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fraction of requests profiled without the X-Profile header (0: only on request)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Whether clients may ask for profiling with the X-Profile header (off unless enabled:
+# any client could otherwise make the server profile its requests)
+PROFILE_HEADER_ENABLED = os.getenv("PROFILE_HEADER_ENABLED", "0") == "1"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ITERATION_BUCKETS = (5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+
+def _label_key(labelnames: Sequence[str], labels: Dict[str, str]) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames: Sequence[str], key: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, key)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(self.labelnames, labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def count(self, **labels) -> float:
+        series = self._series.get(_label_key(self.labelnames, labels))
+        return series[-2] if series else 0.0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = 'le="%g"' % bound
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count:g}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {series[-2]:g}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]:g}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-2]:g}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("robo_stage_seconds", "Duration of instrumented stages", ["stage"])
+CACHE_REQUESTS = REGISTRY.counter("robo_cache_requests_total", "Cache lookups by cache and result", ["cache", "result"])
+SOLVER_SECONDS = REGISTRY.histogram("robo_solver_seconds", "Solver time reported by cvxpy", ["problem", "solver"])
+SOLVER_ITERATIONS = REGISTRY.histogram("robo_solver_iterations", "Solver iterations per solve", ["problem", "solver"], ITERATION_BUCKETS)
+SOLVER_CALLS = REGISTRY.counter("robo_solver_calls_total", "Solver calls by final status", ["problem", "solver", "status"])
+HTTP_SECONDS = REGISTRY.histogram("robo_http_request_seconds", "HTTP request duration", ["method", "route", "status"])
+SINGLEFLIGHT_EXECUTIONS = REGISTRY.counter("robo_singleflight_executions_total", "Computations run by a single-flight leader", ["group"])
+COALESCED_REQUESTS = REGISTRY.counter("robo_coalesced_requests_total", "Requests served by another request's in-flight computation", ["group"])
+SOLVER_SERVICE_REJECTIONS = REGISTRY.counter("robo_solver_service_rejections_total", "Solves rejected because the solver pool was saturated")
+SOLVER_SERVICE_TIMEOUTS = REGISTRY.counter("robo_solver_service_timeouts_total", "Solves abandoned after their timeout")
+
+
+class RequestProfile:
+    """Stage spans of one profiled request, plus the cProfile data of its stages."""
+
+    def __init__(self):
+        self.spans: List[Tuple[str, float]] = []
+        self.profiler = cProfile.Profile()
+        self._lock = threading.Lock()
+        self._active: Dict[int, int] = {}  # thread id -> open stage depth
+        # A Profile object collects one thread at a time
+        self._busy = threading.Lock()
+
+    def add_span(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.spans.append((stage, seconds))
+
+    @contextmanager
+    def profiling(self):
+        """Enable cProfile on the outermost stage of the current thread."""
+        thread = threading.get_ident()
+        with self._lock:
+            depth = self._active.get(thread, 0)
+            self._active[thread] = depth + 1
+        # cProfile is not reentrant: only the outermost stage of one thread at a time
+        enabled = depth == 0 and self._try_enable()
+        try:
+            yield
+        finally:
+            if enabled:
+                self.profiler.disable()
+                self._busy.release()
+            with self._lock:
+                self._active[thread] -= 1
+
+    def _try_enable(self) -> bool:
+        if not self._busy.acquire(blocking=False):
+            return False
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            self._busy.release()
+            return False
+        return True
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: total duration per stage."""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for stage, seconds in self.spans:
+                totals[stage] = totals.get(stage, 0.0) + seconds
+        return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in totals.items())
+
+    def summary(self, limit: int = 25) -> str:
+        stream = io.StringIO()
+        try:
+            pstats.Stats(self.profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+        except TypeError:
+            return "(no profiled stage)"
+        return stream.getvalue()
+
+
+_current_profile: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar("request_profile", default=None)
+
+
+def start_profile() -> contextvars.Token:
+    return _current_profile.set(RequestProfile())
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current_profile.get()
+
+
+def stop_profile(token: contextvars.Token) -> Optional[RequestProfile]:
+    profile = _current_profile.get()
+    _current_profile.reset(token)
+    return profile
+
+
+@contextmanager
+def timed(stage: str):
+    """Time a stage into robo_stage_seconds (and into the request profile, if any)."""
+    profile = _current_profile.get()
+    started = time.perf_counter()
+    try:
+        if profile is None:
+            yield
+        else:
+            with profile.profiling():
+                yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if profile is not None:
+            profile.add_span(stage, elapsed)
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+# Solves recorded in the current context, when captured (see capture_solves)
+_captured_solves: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("captured_solves", default=None)
+
+
+def record_solve(problem_name: str, problem) -> None:
+    """Solver statistics of a solved cvxpy problem (no-op if it was never solved)."""
+    stats = getattr(problem, "solver_stats", None)
+    if stats is None:
+        return
+    observe_solve(problem_name, stats.solver_name or "unknown", problem.status, stats.num_iters, stats.solve_time)
+
+
+def observe_solve(problem_name: str, solver: str, status: str, iterations=None, seconds=None) -> None:
+    captured = _captured_solves.get()
+    if captured is not None:
+        captured.append((problem_name, solver, status, iterations, seconds))
+    SOLVER_CALLS.inc(problem=problem_name, solver=solver, status=status)
+    if iterations is not None:
+        SOLVER_ITERATIONS.observe(iterations, problem=problem_name, solver=solver)
+    if seconds is not None:
+        SOLVER_SECONDS.observe(seconds, problem=problem_name, solver=solver)
+
+
+@contextmanager
+def capture_solves():
+    """Collect the solves recorded inside the block, e.g. to report them from a worker process."""
+    captured: list = []
+    token = _captured_solves.set(captured)
+    try:
+        yield captured
+    finally:
+        _captured_solves.reset(token)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,221 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.columnar import MARKET_DATA_DIR, derived_path
+from services.large_universe import LowRankCovariance, factor_model_low_rank, historical_mean_returns, ledoit_wolf_low_rank
+from services.market_data import market_data
+from services.metrics import cache_lookup, timed
+from services.online_moments import OnlineMoments, load_moments
+
+MAX_CACHED_MOMENTS = 16
+
+
+# pypfopt (and cvxpy behind it) is imported on first use, not when the API starts
+def _mean_historical_return(prices, frequency):
+    from pypfopt import expected_returns
+    return expected_returns.mean_historical_return(prices, frequency=frequency)
+
+
+def _ema_historical_return(prices, frequency):
+    from pypfopt import expected_returns
+    return expected_returns.ema_historical_return(prices, frequency=frequency)
+
+
+def _sample_cov(prices, frequency):
+    from pypfopt import risk_models
+    return risk_models.sample_cov(prices, frequency=frequency)
+
+
+def _exp_cov(prices, frequency):
+    from pypfopt import risk_models
+    return risk_models.exp_cov(prices, frequency=frequency)
+
+
+def _ledoit_wolf(prices, frequency):
+    from pypfopt import risk_models
+    return risk_models.CovarianceShrinkage(prices, frequency=frequency).ledoit_wolf()
+
+
+# estimator -> (expected returns, covariance), both taking (prices, frequency)
+ESTIMATORS = {
+    "sample": (_mean_historical_return, _sample_cov),
+    "ema": (_ema_historical_return, _exp_cov),
+    "ledoit_wolf": (_mean_historical_return, _ledoit_wolf),
+}
+
+# Covariance estimators in low-rank plus diagonal form, taking (returns, frequency)
+LOW_RANK_ESTIMATORS = {
+    "ledoit_wolf": ledoit_wolf_low_rank,
+    "factor": lambda returns, frequency: factor_model_low_rank(returns, frequency=frequency),
+}
+
+# Checkpoint of the running sample moments of the shared panel (deleted by write_panel)
+ONLINE_CHECKPOINT = derived_path(MARKET_DATA_DIR, "prices", "moments_sample.npz")
+
+_cache: "OrderedDict[Tuple[str, str, int], tuple]" = OrderedDict()
+_lock = threading.Lock()
+_online = {"estimator": None}
+_online_lock = threading.Lock()
+
+
+def dataset_version(prices: pd.DataFrame) -> str:
+    """Version of a price panel: the store hash when available, else a content hash."""
+    version = prices.attrs.get("version")
+    if version is not None:
+        return version
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(pd.util.hash_pandas_object(prices, index=True).to_numpy().tobytes())
+    digest.update("\x1f".join(map(str, prices.columns)).encode())
+    return digest.hexdigest()
+
+
+def _lineage(returns: np.ndarray, count: int) -> "hashlib.blake2b":
+    """Running hash of the first `count` return rows (the bars an estimator has covered)."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(returns[:count]).tobytes())
+    return digest
+
+
+def _online_sample_moments(prices: pd.DataFrame, frequency: int) -> Optional[Tuple[pd.Series, pd.DataFrame]]:
+    """
+    Sample moments of the shared panel from the online estimator: only the bars appended
+    since its last update (or its checkpoint) are scanned. Returns None when the panel is
+    not the shared one or has gaps, so the caller falls back to a full pypfopt estimate.
+    """
+    if dataset_version(prices) != market_data.version:
+        return None
+    returns = market_data.returns()
+    if len(returns) < 2:
+        return None
+    tickers = [str(t) for t in returns.columns]
+    matrix = returns.to_numpy()
+
+    with _online_lock:
+        estimator = _online["estimator"]
+        if estimator is None and os.path.exists(ONLINE_CHECKPOINT):
+            try:
+                estimator = load_moments(ONLINE_CHECKPOINT)
+            except (OSError, ValueError, KeyError):
+                estimator = None
+
+        # Reused only if the bars it covered are unchanged: same last date and same content
+        # (a full rewrite of the history, e.g. restated prices, starts a new estimator).
+        # Hashing the covered rows is O(T * N), well below a full O(T * N^2) estimate.
+        digest = None
+        if (
+            estimator is not None
+            and estimator.kind == "sample"
+            and estimator.tickers == tickers
+            and 0 < estimator.count <= len(returns)
+            and pd.Timestamp(returns.index[estimator.count - 1]).value == estimator.last_date
+        ):
+            digest = _lineage(matrix, estimator.count)
+            if digest.hexdigest() != estimator.lineage:
+                digest = None
+        if digest is None:
+            estimator = OnlineMoments(tickers)
+            digest = _lineage(matrix, 0)
+
+        new_rows = matrix[estimator.count:]
+        if np.isnan(new_rows).any():
+            return None
+        if len(new_rows):
+            estimator.update(new_rows, last_date=pd.Timestamp(returns.index[-1]).value)
+            digest.update(np.ascontiguousarray(new_rows).tobytes())
+            estimator.lineage = digest.hexdigest()
+            if os.path.isdir(MARKET_DATA_DIR):
+                estimator.save(ONLINE_CHECKPOINT)
+        _online["estimator"] = estimator
+
+        mu = pd.Series(estimator.expected_returns(frequency), index=returns.columns)
+        S = pd.DataFrame(estimator.covariance(frequency), index=returns.columns, columns=returns.columns)
+    from pypfopt import risk_models
+    return mu, risk_models.fix_nonpositive_semidefinite(S, "spectral")
+
+
+def get_moments(
+    prices: Optional[pd.DataFrame] = None,
+    estimator: str = "sample",
+    frequency: int = 252,
+) -> Tuple[pd.Series, pd.DataFrame]:
+    """
+    Annualised (mu, S) for a price panel, memoised per (dataset version, estimator, frequency).
+    Defaults to the shared market-data panel, whose sample moments are maintained
+    incrementally as days are appended. The returned objects are shared between
+    callers and must not be modified in place.
+    """
+    if estimator not in ESTIMATORS:
+        raise ValueError(f"Unknown moment estimator: {estimator}")
+    if prices is None:
+        prices = market_data.prices()
+
+    key = (dataset_version(prices), estimator, frequency)
+    with _lock:
+        cached = _cache.get(key)
+        cache_lookup("moments", cached is not None)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+
+    with timed("moments"):
+        online = _online_sample_moments(prices, frequency) if estimator == "sample" else None
+        if online is not None:
+            mu, S = online
+        else:
+            mu_fn, cov_fn = ESTIMATORS[estimator]
+            mu = mu_fn(prices, frequency)
+            S = cov_fn(prices, frequency)
+
+    with _lock:
+        _cache[key] = (mu, S)
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_CACHED_MOMENTS:
+            _cache.popitem(last=False)
+    return mu, S
+
+
+def get_low_rank_moments(
+    prices: Optional[pd.DataFrame] = None,
+    estimator: str = "ledoit_wolf",
+    frequency: int = 252,
+) -> Tuple[pd.Series, LowRankCovariance]:
+    """
+    Annualised (mu, S) with S in low-rank plus diagonal form, for large universes.
+    Shares the memo of get_moments; the N x N covariance is never built.
+    """
+    if estimator not in LOW_RANK_ESTIMATORS:
+        raise ValueError(f"Unknown low-rank estimator: {estimator}")
+    if prices is None:
+        prices = market_data.prices()
+
+    key = (dataset_version(prices), f"low_rank:{estimator}", frequency)
+    with _lock:
+        cached = _cache.get(key)
+        cache_lookup("moments", cached is not None)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+
+    with timed("moments"):
+        # Same returns as pypfopt's shrinkage estimators: all-NaN rows dropped, gaps as zero
+        returns = np.nan_to_num(prices.pct_change().dropna(how="all").to_numpy(dtype=float))
+        mu = pd.Series(historical_mean_returns(returns, frequency), index=prices.columns)
+        S = LOW_RANK_ESTIMATORS[estimator](returns, frequency)
+
+    with _lock:
+        _cache[key] = (mu, S)
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_CACHED_MOMENTS:
+            _cache.popitem(last=False)
+    return mu, S
+
+
+def clear_moments_cache() -> None:
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,243 @@
+"""
+Monte Carlo projection of a portfolio's wealth over the user's horizon (monthly steps).
+
+Two return models:
+- "normal": normal monthly log-returns of the portfolio (lognormal wealth). The expected
+  return of the profile portfolios is a compounded annual growth rate (pypfopt's
+  mean_historical_return), so the log drift is log(1 + CAGR) / 12: the median path grows
+  at that rate. The volatility is the annual volatility of the portfolio.
+- "bootstrap": each month is a random one-month window of the historical daily
+  portfolio returns (block bootstrap, keeps fat tails and intra-month autocorrelation).
+
+Paths are simulated in chunks of CHUNK_SIZE, each with its own child of a SeedSequence,
+so results only depend on the seed and the path count (not on the number of workers).
+A chunk only leaves a per-month histogram of log-wealth behind: memory stays bounded
+whatever the path count, and partial results can be streamed as chunks complete.
+With MONTE_CARLO_WORKERS > 0, chunks run in one module-level spawn pool shared by all
+requests (spawn: workers do not inherit the web server's threads and locks).
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from services.metrics import timed
+
+# Paths simulated per batch, and processes of the shared pool (0: in-process)
+CHUNK_SIZE = int(os.getenv("MONTE_CARLO_CHUNK_SIZE", "10000"))
+WORKERS = int(os.getenv("MONTE_CARLO_WORKERS", "0"))
+MAX_PATHS = int(os.getenv("MONTE_CARLO_MAX_PATHS", "1000000"))
+
+MONTHS_PER_YEAR = 12
+TRADING_DAYS_PER_MONTH = 21
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+METHODS = ("normal", "bootstrap")
+
+# Histogram resolution: N_BINS over +/- GRID_SIGMAS standard deviations of log-wealth
+N_BINS = 2048
+GRID_SIGMAS = 8.0
+
+# Annual growth implied by each investment objective, used as default target
+OBJECTIVE_TARGET_RATES = {
+    "préservation du capital": 0.0,
+    "croissance modérée": 0.04,
+    "croissance agressive": 0.07,
+}
+
+
+_pool = {"executor": None}
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ProcessPoolExecutor:
+    with _pool_lock:
+        if _pool["executor"] is None:
+            from services.solver_service import disable_solver_service
+            _pool["executor"] = ProcessPoolExecutor(
+                max_workers=WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=disable_solver_service,
+            )
+        return _pool["executor"]
+
+
+def shutdown() -> None:
+    """Stop the shared pool (application shutdown, or after a worker died)."""
+    with _pool_lock:
+        if _pool["executor"] is not None:
+            _pool["executor"].shutdown(wait=False, cancel_futures=True)
+            _pool["executor"] = None
+
+
+def normal_model(expected_return: float, volatility: float) -> dict:
+    """
+    Monthly normal model of log-returns from the annual expected return (compounded,
+    as reported by portfolio_performance) and volatility of the portfolio.
+    """
+    return {
+        "method": "normal",
+        "log_mean": float(np.log1p(expected_return) / MONTHS_PER_YEAR),
+        "log_std": float(volatility / np.sqrt(MONTHS_PER_YEAR)),
+    }
+
+
+def bootstrap_model(prices: pd.DataFrame, weights: Dict[str, float]) -> dict:
+    """Overlapping one-month log-returns of the historical portfolio (fixed weights)."""
+    tickers = [t for t, w in weights.items() if w > 0 and t in prices.columns]
+    if not tickers:
+        raise ValueError("No overlap between portfolio weights and price data")
+    w = np.array([weights[t] for t in tickers], dtype=float)
+    daily = prices[tickers].pct_change().dropna().to_numpy() @ (w / w.sum())
+    log_daily = np.log1p(np.maximum(daily, -0.999))
+    if len(log_daily) < TRADING_DAYS_PER_MONTH:
+        raise ValueError("Not enough price history for a bootstrap projection")
+    cumulative = np.concatenate(([0.0], np.cumsum(log_daily)))
+    monthly = cumulative[TRADING_DAYS_PER_MONTH:] - cumulative[:-TRADING_DAYS_PER_MONTH]
+    return {"method": "bootstrap", "history": monthly}
+
+
+def _log_moments(model: dict):
+    """Mean and standard deviation of the monthly log-return (used to place the grid)."""
+    if model["method"] == "normal":
+        return model["log_mean"], model["log_std"]
+    history = model["history"]
+    return float(history.mean()), float(history.std())
+
+
+def _grid(model: dict, n_steps: int):
+    """Per-month histogram bounds (lower edge, bin width) of log-wealth."""
+    mean, std = _log_moments(model)
+    steps = np.arange(1, n_steps + 1)
+    half_width = np.maximum(GRID_SIGMAS * std * np.sqrt(steps), 1e-3)
+    return steps * mean - half_width, 2.0 * half_width / N_BINS
+
+
+def _monthly_log_returns(model: dict, rng: np.random.Generator, n_paths: int, n_steps: int) -> np.ndarray:
+    if model["method"] == "normal":
+        return model["log_mean"] + model["log_std"] * rng.standard_normal((n_paths, n_steps))
+    history = model["history"]
+    return history[rng.integers(len(history), size=(n_paths, n_steps))]
+
+
+def _simulate_chunk(model: dict, n_paths: int, n_steps: int, lower, width, target_log: float, seed) -> tuple:
+    """
+    One batch of paths, reduced to (histogram of log-wealth per month, paths reaching the target).
+    Returns: (int64 array (n_steps, N_BINS), int)
+    """
+    rng = np.random.default_rng(seed)
+    log_wealth = np.cumsum(_monthly_log_returns(model, rng, n_paths, n_steps), axis=1)
+    bins = np.clip(((log_wealth - lower) / width).astype(np.int64), 0, N_BINS - 1)
+    bins += np.arange(n_steps) * N_BINS
+    histogram = np.bincount(bins.ravel(), minlength=n_steps * N_BINS).reshape(n_steps, N_BINS)
+    return histogram, int(np.count_nonzero(log_wealth[:, -1] >= target_log))
+
+
+def histogram_percentiles(histogram: np.ndarray, lower, width, percentiles: Sequence[float]) -> np.ndarray:
+    """
+    Percentiles of log-wealth per month from the histograms, interpolated within a bin.
+    Returns: array (len(percentiles), n_steps)
+    """
+    cdf = np.cumsum(histogram, axis=1)
+    total = cdf[:, -1:]
+    steps = np.arange(len(histogram))
+    result = np.empty((len(percentiles), len(histogram)))
+    for i, q in enumerate(percentiles):
+        rank = total[:, 0] * q / 100.0
+        index = np.argmax(cdf >= rank[:, None], axis=1)
+        below = np.where(index > 0, cdf[steps, index - 1], 0)
+        in_bin = np.maximum(histogram[steps, index], 1)
+        fraction = np.clip((rank - below) / in_bin, 0.0, 1.0)
+        result[i] = lower + (index + fraction) * width
+    return result
+
+
+def default_target(objectif: str, horizon_years: int) -> float:
+    """Wealth multiple implied by the objective after `horizon_years`."""
+    return float((1.0 + OBJECTIVE_TARGET_RATES.get(objectif, 0.0)) ** horizon_years)
+
+
+def iter_projection(
+    model: dict,
+    horizon_years: int,
+    n_paths: int = 100_000,
+    target: float = 1.0,
+    initial: float = 1.0,
+    seed: Optional[int] = None,
+    parallel: bool = True,
+    chunk_size: int = CHUNK_SIZE,
+    percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+) -> Iterator[dict]:
+    """
+    Simulate `n_paths` wealth paths of `horizon_years`, yielding the fan chart computed on
+    the paths completed so far after each chunk (the last item covers every path).
+    `target` is a wealth multiple; bands and the returned target are amounts (x `initial`).
+    parallel: run the chunks in the shared pool (when MONTE_CARLO_WORKERS > 0).
+    Yields: {'months', 'percentiles': {q: [...]}, 'probability', 'target', 'paths', 'total_paths', 'seed', 'done'}
+    """
+    if n_paths <= 0 or n_paths > MAX_PATHS:
+        raise ValueError(f"Path count must be between 1 and {MAX_PATHS}")
+    if horizon_years <= 0:
+        raise ValueError("Horizon must be positive")
+
+    n_steps = horizon_years * MONTHS_PER_YEAR
+    lower, width = _grid(model, n_steps)
+    target_log = float(np.log(target)) if target > 0 else -np.inf
+    sizes = [min(chunk_size, n_paths - start) for start in range(0, n_paths, chunk_size)]
+    seed_sequence = np.random.SeedSequence(seed)
+    children = seed_sequence.spawn(len(sizes))
+    tasks = [(model, size, n_steps, lower, width, target_log, child) for size, child in zip(sizes, children)]
+
+    histogram = np.zeros((n_steps, N_BINS), dtype=np.int64)
+    state = {"paths": 0, "reached": 0}
+
+    def snapshot() -> dict:
+        bands = initial * np.exp(histogram_percentiles(histogram, lower, width, percentiles))
+        return {
+            "months": list(range(n_steps + 1)),
+            # Month 0: every path starts from the initial amount
+            "percentiles": {str(q): [float(initial)] + band.tolist() for q, band in zip(percentiles, bands)},
+            "probability": state["reached"] / state["paths"],
+            "target": float(target * initial),
+            "paths": state["paths"],
+            "total_paths": n_paths,
+            "seed": seed_sequence.entropy,
+            "done": state["paths"] == n_paths,
+        }
+
+    def accumulate(chunk: tuple, size: int) -> None:
+        np.add(histogram, chunk[0], out=histogram)
+        state["reached"] += chunk[1]
+        state["paths"] += size
+
+    if parallel and WORKERS > 0 and len(tasks) > 1:
+        pool = _executor()
+        futures = {pool.submit(_simulate_chunk, *task): task[1] for task in tasks}
+        try:
+            for future in as_completed(futures):
+                accumulate(future.result(), futures[future])
+                yield snapshot()
+        except BrokenProcessPool:
+            shutdown()
+            raise
+        finally:
+            # Stream closed early (client gone) or failure: drop the chunks not started
+            for future in futures:
+                future.cancel()
+    else:
+        for task in tasks:
+            with timed("monte_carlo"):
+                accumulate(_simulate_chunk(*task), task[1])
+            yield snapshot()
+
+
+def run_projection(model: dict, horizon_years: int, **kwargs) -> dict:
+    """Final result of iter_projection (see there for the arguments)."""
+    result = None
+    for result in iter_projection(model, horizon_years, **kwargs):
+        pass
+    return result
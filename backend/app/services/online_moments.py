@@ -0,0 +1,187 @@
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+class OnlineMoments:
+    """
+    Running mean and covariance of daily returns (Welford / Chan batch merge), plus the
+    running log growth used for the compounded annual return.
+    Each update costs O(k * N^2) for k new bars instead of a rescan of the full history,
+    and matches pypfopt's mean_historical_return / sample_cov on the same returns.
+    """
+
+    kind = "sample"
+
+    def __init__(self, tickers: Sequence[str]):
+        n = len(tickers)
+        self.tickers = [str(t) for t in tickers]
+        self.count = 0
+        self.mean = np.zeros(n)
+        self.m2 = np.zeros((n, n))
+        self.log_growth = np.zeros(n)
+        self.last_date: Optional[int] = None  # int64 ns timestamp of the last bar seen
+        self.lineage: Optional[str] = None    # hash of the bars seen, set by the owner (see services.moments)
+
+    def update(self, returns: np.ndarray, last_date: Optional[int] = None) -> None:
+        returns = np.atleast_2d(np.asarray(returns, dtype=float))
+        k = returns.shape[0]
+        if k == 0:
+            return
+
+        batch_mean = returns.mean(axis=0)
+        centered = returns - batch_mean
+        batch_m2 = centered.T @ centered
+
+        total = self.count + k
+        delta = batch_mean - self.mean
+        self.m2 += batch_m2 + np.outer(delta, delta) * (self.count * k / total)
+        self.mean += delta * (k / total)
+        self.log_growth += np.log1p(returns).sum(axis=0)
+        self.count = total
+        if last_date is not None:
+            self.last_date = int(last_date)
+
+    def expected_returns(self, frequency: int = 252) -> np.ndarray:
+        """Compounded annual return: prod(1 + r) ** (frequency / n) - 1."""
+        return np.expm1(self.log_growth * (frequency / self.count))
+
+    def covariance(self, frequency: int = 252) -> np.ndarray:
+        return self.m2 / (self.count - 1) * frequency
+
+    def _state(self) -> dict:
+        return {"mean": self.mean, "m2": self.m2, "log_growth": self.log_growth}
+
+    def save(self, path: str) -> None:
+        """Checkpoint the estimator state (np.savez)."""
+        np.savez(
+            path,
+            kind=self.kind,
+            tickers=np.array(self.tickers),
+            count=self.count,
+            last_date=-1 if self.last_date is None else self.last_date,
+            lineage="" if self.lineage is None else self.lineage,
+            **self._state(),
+        )
+
+    def _load_state(self, data) -> None:
+        self.mean = data["mean"]
+        self.m2 = data["m2"]
+        self.log_growth = data["log_growth"]
+
+
+class EWMAMoments(OnlineMoments):
+    """Exponentially weighted mean and covariance, O(N^2) per bar."""
+
+    kind = "ewma"
+
+    def __init__(self, tickers: Sequence[str], span: int = 180):
+        super().__init__(tickers)
+        self.span = span
+        self.alpha = 2.0 / (span + 1.0)
+        self.cov = np.zeros((len(self.tickers), len(self.tickers)))
+
+    def update(self, returns: np.ndarray, last_date: Optional[int] = None) -> None:
+        returns = np.atleast_2d(np.asarray(returns, dtype=float))
+        for row in returns:
+            if self.count == 0:
+                self.mean = row.copy()
+            else:
+                delta = row - self.mean
+                self.mean += self.alpha * delta
+                self.cov = (1 - self.alpha) * (self.cov + self.alpha * np.outer(delta, delta))
+            self.count += 1
+        self.log_growth += np.log1p(returns).sum(axis=0)
+        if last_date is not None:
+            self.last_date = int(last_date)
+
+    def expected_returns(self, frequency: int = 252) -> np.ndarray:
+        """Annualised exponentially weighted mean return."""
+        return self.mean * frequency
+
+    def covariance(self, frequency: int = 252) -> np.ndarray:
+        return self.cov * frequency
+
+    def _state(self) -> dict:
+        return {"mean": self.mean, "cov": self.cov, "log_growth": self.log_growth, "span": self.span}
+
+    def _load_state(self, data) -> None:
+        self.mean = data["mean"]
+        self.cov = data["cov"]
+        self.log_growth = data["log_growth"]
+
+
+class RollingMoments(OnlineMoments):
+    """
+    Mean and covariance over the last `window` bars. Keeps running sums and a ring buffer
+    of the window: each bar adds the new row and removes the one leaving, O(N^2).
+    """
+
+    kind = "rolling"
+
+    def __init__(self, tickers: Sequence[str], window: int = 252):
+        super().__init__(tickers)
+        n = len(self.tickers)
+        self.window = window
+        self.buffer = np.zeros((window, n))
+        self.sum = np.zeros(n)
+        self.cross = np.zeros((n, n))
+
+    def update(self, returns: np.ndarray, last_date: Optional[int] = None) -> None:
+        returns = np.atleast_2d(np.asarray(returns, dtype=float))
+        for row in returns:
+            slot = self.count % self.window
+            if self.count >= self.window:
+                leaving = self.buffer[slot]
+                self.sum -= leaving
+                self.cross -= np.outer(leaving, leaving)
+                self.log_growth -= np.log1p(leaving)
+            self.buffer[slot] = row
+            self.sum += row
+            self.cross += np.outer(row, row)
+            self.log_growth += np.log1p(row)
+            self.count += 1
+        if last_date is not None:
+            self.last_date = int(last_date)
+
+    @property
+    def size(self) -> int:
+        return min(self.count, self.window)
+
+    def expected_returns(self, frequency: int = 252) -> np.ndarray:
+        return np.expm1(self.log_growth * (frequency / self.size))
+
+    def covariance(self, frequency: int = 252) -> np.ndarray:
+        n = self.size
+        mean = self.sum / n
+        return (self.cross - n * np.outer(mean, mean)) / (n - 1) * frequency
+
+    def _state(self) -> dict:
+        return {"buffer": self.buffer, "sum": self.sum, "cross": self.cross, "log_growth": self.log_growth, "window": self.window}
+
+    def _load_state(self, data) -> None:
+        self.buffer = data["buffer"]
+        self.sum = data["sum"]
+        self.cross = data["cross"]
+        self.log_growth = data["log_growth"]
+
+
+def load_moments(path: str) -> OnlineMoments:
+    """Restore an estimator checkpointed with save()."""
+    with np.load(path) as data:
+        kind = str(data["kind"])
+        tickers = [str(t) for t in data["tickers"]]
+        if kind == "ewma":
+            estimator = EWMAMoments(tickers, span=int(data["span"]))
+        elif kind == "rolling":
+            estimator = RollingMoments(tickers, window=int(data["window"]))
+        else:
+            estimator = OnlineMoments(tickers)
+        estimator.count = int(data["count"])
+        last_date = int(data["last_date"])
+        estimator.last_date = None if last_date < 0 else last_date
+        # Checkpoints written before lineages were recorded cannot be validated: never reused
+        lineage = str(data["lineage"]) if "lineage" in data.files else ""
+        estimator.lineage = lineage or None
+        estimator._load_state(data)
+    return estimator
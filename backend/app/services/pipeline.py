@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from schemas.user import UserProfileIn
+from services.market_data import market_data
+from services.metrics import cache_lookup, timed
+from services.portfolio_engine import (
+    compute_efficient_frontier_points,
+    compute_historical_series,
+    get_assets_for_profile,
+    get_profile_portfolio,
+)
+from services.profiling import classify_profile
+from services.rag_engine import get_recommendation_for_profile
+from services.series import performance_payload
+from services.singleflight import SingleFlight
+from services.solver_service import SolverError
+
+logger = logging.getLogger(__name__)
+
+# Lifetime (seconds) and maximum number of cached recommendation results
+RESULT_TTL = float(os.getenv("RESULT_CACHE_TTL", "900"))
+MAX_RESULTS = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+
+
+class RecommendationPipeline:
+    """
+    Computes a user's recommendation once (classification, portfolio, backtest, frontier, RAG)
+    and keeps it for `ttl` seconds under a result id (hash of the payload), so that the PDF
+    of a previewed result is rendered without recomputing anything.
+    Cached entries: {'payload': UserProfileIn, 'weights': full weights,
+    'performance': backtest Series (or {'error': ...}), 'result': response body without the series}
+    """
+
+    def __init__(self, ttl: float = RESULT_TTL, max_results: int = MAX_RESULTS):
+        self.ttl = ttl
+        self.max_results = max_results
+        self._results: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Identical concurrent questionnaires: one computation per (profil, data version)
+        self._profile_flights = SingleFlight("profile_result")
+
+    @staticmethod
+    def result_id(payload: UserProfileIn) -> str:
+        return hashlib.blake2b(payload.model_dump_json().encode(), digest_size=16).hexdigest()
+
+    def compute(self, payload: UserProfileIn) -> dict:
+        """Full computation, without cache. Raises ValueError when no portfolio can be built."""
+        with timed("classification"):
+            risk_score, profil = classify_profile(
+                age=payload.age,
+                risk_aversion=payload.risk_aversion.value,
+                horizon=payload.horizon,
+                revenu=payload.revenu,
+                objectif=payload.objectif.value,
+                esg_preference=payload.esg_preference
+            )
+
+        prices = market_data.prices()
+        if prices.empty:
+            raise ValueError("Aucun ticker valide trouvé dans les données de prix")
+
+        # Everything below the classification only depends on the profile and the data
+        shared, _ = self._profile_flights.do(
+            (profil, prices.attrs["version"]), lambda: self._profile_result(profil, prices)
+        )
+        user_ret, user_risk = shared["user_ret"], shared["user_risk"]
+
+        result = {
+            "age": payload.age,
+            "revenu": payload.revenu,
+            "horizon": payload.horizon,
+            "risk_aversion": payload.risk_aversion.value,
+            "objectif": payload.objectif.value,
+            "profil": profil,
+            "risk_score": risk_score,
+            "classes_actifs": get_assets_for_profile(profil),
+            "recommendation": shared["recommendation"],
+            "portfolio_alloc": shared["portfolio_alloc"],
+            "user_portfolio": {
+                "risk": float(user_risk),
+                "ret": float(user_ret)
+            },
+            "frontier_points": shared["frontier_points"],
+            "user_point": {'risk': float(user_risk), 'return': float(user_ret)}
+        }
+        return {"payload": payload, "weights": shared["weights"], "performance": shared["performance"], "result": result}
+
+    @staticmethod
+    def _profile_result(profil: str, prices) -> dict:
+        """Portfolio, backtest, frontier and recommendation of a profile (shared, read-only)."""
+        # Portefeuille optimal précalculé pour le profil, allocations à 0% exclues
+        portfolio = get_profile_portfolio(profil)
+        user_ret, user_risk, _ = portfolio["performance"]
+        portfolio_alloc = {asset: weight for asset, weight in portfolio["weights"].items() if weight > 0}
+        if not portfolio_alloc:
+            raise ValueError("No overlap between portfolio_alloc and price data")
+
+        performance = {'error': 'Computation failed'}
+        frontier_points = []
+        try:
+            performance = compute_historical_series(prices, portfolio_alloc)
+            frontier_points = compute_efficient_frontier_points(prices)
+        except SolverError:
+            # Saturated or timed out: the request fails (503) rather than caching a result without frontier
+            raise
+        except Exception as e:
+            logger.warning("Visualization computation error: %s", e, exc_info=True)
+
+        return {
+            "weights": portfolio["weights"],
+            "portfolio_alloc": portfolio_alloc,
+            "user_ret": user_ret,
+            "user_risk": user_risk,
+            "performance": performance,
+            "frontier_points": frontier_points,
+            "recommendation": get_recommendation_for_profile(profil),
+        }
+
+    @staticmethod
+    def response(entry: dict, points: Optional[int] = None, method: str = "lttb", encoding: str = "json") -> dict:
+        """Response body of an entry, with the performance series in the requested form."""
+        return {**entry["result"], "sim_performance": performance_payload(entry["performance"], points, method, encoding)}
+
+    def get(self, result_id: str) -> Optional[dict]:
+        """Cached entry of a result id, or None if unknown or expired."""
+        with self._lock:
+            cached = self._results.get(result_id)
+            if cached is None:
+                return None
+            created, entry = cached
+            if time.monotonic() - created > self.ttl:
+                del self._results[result_id]
+                return None
+            self._results.move_to_end(result_id)
+            return entry
+
+    def run(self, payload: UserProfileIn) -> Tuple[str, dict]:
+        """(result id, entry) for a payload, computed only if not cached."""
+        result_id = self.result_id(payload)
+        entry = self.get(result_id)
+        cache_lookup("recommendation", entry is not None)
+        if entry is not None:
+            return result_id, entry
+
+        entry = self.compute(payload)
+        with self._lock:
+            # Same payload computed concurrently: keep the entry stored first (one result per id)
+            cached = self._results.get(result_id)
+            if cached is not None and time.monotonic() - cached[0] <= self.ttl:
+                return result_id, cached[1]
+            self._results[result_id] = (time.monotonic(), entry)
+            self._results.move_to_end(result_id)
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        return result_id, entry
+
+    def claim_user_save(self, entry: dict) -> bool:
+        """True for the first caller only: the user of a result is saved once, not per request."""
+        with self._lock:
+            if entry.get("user_saved"):
+                return False
+            entry["user_saved"] = True
+            return True
+
+    def release_user_save(self, entry: dict) -> None:
+        """The save failed: let a later request save the user."""
+        with self._lock:
+            entry["user_saved"] = False
+
+    def clear(self, *_) -> None:
+        with self._lock:
+            self._results.clear()
+
+
+recommendation_pipeline = RecommendationPipeline()
+# Results depend on the market data: drop them when it is reloaded
+market_data.add_listener(recommendation_pipeline.clear)
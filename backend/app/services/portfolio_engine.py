@@ -1,7 +1,25 @@
-from typing import Dict
+from typing import Dict, Union
+import logging
+import threading
 import pandas as pd
 import numpy as np
-from pypfopt import expected_returns, risk_models, EfficientFrontier
+from services.market_data import market_data
+from services.metrics import cache_lookup, record_solve, timed
+from services.moments import get_low_rank_moments, get_moments
+from services.large_universe import (
+    LARGE_UNIVERSE_MAX_ASSETS,
+    LowRankCovariance,
+    group_bounds,
+    is_large_universe,
+    low_rank_performance,
+    optimize_low_rank,
+)
+from services.frontier import frontier_cache
+from services.backtest import backtest_portfolios
+from services.series import to_json_lists
+from services.solver_service import profile_task, solver_service
+
+logger = logging.getLogger(__name__)
 
 ASSET_CLASSES = {
     "obligations": ["BND", "AGG", "TLT"],
@@ -27,22 +45,114 @@ PROFILE_ALLOCATIONS = {
     }
 }
 
+# Optimisation objective behind each profile: (method, target volatility)
+PROFILE_OBJECTIVES = {
+    "conservateur": ("max_sharpe", None),
+    "modéré": ("efficient_risk", 0.15),
+    "dynamique": ("efficient_risk", 0.25),
+}
+
+# Tolerance around PROFILE_ALLOCATIONS for the asset-class constraints of large universes
+GROUP_TOLERANCE = 0.10
+
+_profile_portfolios = {"version": None, "portfolios": {}}
+_profile_lock = threading.RLock()
+
+
+def _solve_profile_portfolio(profil: str, mu: pd.Series, S: pd.DataFrame) -> dict:
+    # pypfopt/cvxpy are imported on first use (fast API start, see services.warmup)
+    from pypfopt import EfficientFrontier
+    from pypfopt.base_optimizer import portfolio_performance
+
+    method, target_volatility = PROFILE_OBJECTIVES.get(profil, PROFILE_OBJECTIVES["dynamique"])
+    ef = EfficientFrontier(mu, S)
+    with timed("solver"):
+        if method == "max_sharpe":
+            ef.max_sharpe()
+        else:
+            ef.efficient_risk(target_volatility=target_volatility)
+    record_solve(f"profile_{method}", ef._opt)
+
+    weights = ef.clean_weights()
+    performance = portfolio_performance(weights, mu, S)
+    return {"weights": weights, "performance": performance}
+
+
+def _solve_large_profile_portfolio(profil: str, mu: pd.Series, S) -> dict:
+    """
+    Large-universe variant: low-rank covariance, asset-class bounds from
+    PROFILE_ALLOCATIONS and a cardinality limit. The class bounds are dropped
+    if they make the profile's objective infeasible.
+    """
+    method, target_volatility = PROFILE_OBJECTIVES.get(profil, PROFILE_OBJECTIVES["dynamique"])
+    groups = group_bounds(mu.index, ASSET_CLASSES, PROFILE_ALLOCATIONS.get(profil, {}), GROUP_TOLERANCE)
+    max_assets = LARGE_UNIVERSE_MAX_ASSETS or None
+    try:
+        weights = optimize_low_rank(mu, S, method, target_volatility, groups, max_assets)
+    except ValueError as e:
+        logger.warning("%s asset-class constraints dropped (%s)", profil, e)
+        weights = optimize_low_rank(mu, S, method, target_volatility, None, max_assets)
+
+    return {"weights": weights, "performance": low_rank_performance(weights, mu, S)}
+
+
+def solve_profile_on_moments(profil: str, mu: pd.Series, S) -> dict:
+    """Profile portfolio for given moments (dense S, or LowRankCovariance on large universes)."""
+    if isinstance(S, LowRankCovariance):
+        return _solve_large_profile_portfolio(profil, mu, S)
+    return _solve_profile_portfolio(profil, mu, S)
+
+
+def profile_moments(prices: pd.DataFrame):
+    """(mu, S) used by the profile optimisers: low-rank S on large universes, dense S otherwise."""
+    if is_large_universe(prices.shape[1], len(prices) - 1):
+        return get_low_rank_moments(prices)
+    return get_moments(prices)
+
+
+def precompute_profile_portfolios() -> dict:
+    """
+    Solve the optimal portfolio of every profile for the current price data.
+    Returns: {profil: {'weights': OrderedDict, 'performance': (ret, vol, sharpe)}}
+    """
+    with _profile_lock:
+        prices = market_data.prices()
+        version = prices.attrs["version"]
+        cache_lookup("profile_portfolios", _profile_portfolios["version"] == version)
+        if _profile_portfolios["version"] == version:
+            return _profile_portfolios["portfolios"]
+
+        mu, S = profile_moments(prices)
+        profils = list(PROFILE_OBJECTIVES)
+        if solver_service.enabled:
+            # The three solves run in parallel in the solver pool, this thread only waits
+            ref = solver_service.publish(version, mu, S)
+            solved = solver_service.run_many(profile_task, [(ref, profil) for profil in profils])
+        else:
+            solved = [solve_profile_on_moments(profil, mu, S) for profil in profils]
+        portfolios = dict(zip(profils, solved))
+        _profile_portfolios["portfolios"] = portfolios
+        _profile_portfolios["version"] = version
+        return portfolios
+
+
+def invalidate_profile_portfolios(*_) -> None:
+    with _profile_lock:
+        _profile_portfolios["version"] = None
+        _profile_portfolios["portfolios"] = {}
+
+
+market_data.add_listener(invalidate_profile_portfolios)
+
+
+def get_profile_portfolio(profil: str) -> dict:
+    """Precomputed portfolio of a profile (unknown profiles fall back to "dynamique")."""
+    portfolios = precompute_profile_portfolios()
+    return portfolios.get(profil, portfolios["dynamique"])
+
+
 def generate_initial_portfolio(profil: str) -> dict:
-    prices = pd.read_csv("prices.csv", index_col=0, parse_dates=True)
-    mu = expected_returns.mean_historical_return(prices)
-    S = risk_models.sample_cov(prices)
-
-    if profil == "conservateur":
-        ef = EfficientFrontier(mu, S)
-        ef.max_sharpe()
-    elif profil == "modéré":
-        ef = EfficientFrontier(mu, S)
-        ef.efficient_risk(target_volatility=0.15)
-    else:
-        ef = EfficientFrontier(mu, S)
-        ef.efficient_risk(target_volatility=0.25)
-
-    return ef.clean_weights()
+    return get_profile_portfolio(profil)["weights"]
 
 def get_assets_for_profile(profil: str) -> dict:
     profil = profil.lower()
@@ -53,79 +163,50 @@ def compute_historical_performance(prices: pd.DataFrame, weights: dict) -> dict:
     Simulate historical portfolio performance.
     Returns: {'dates': list of dates, 'cumulative_returns': list of cumulative returns}
     """
+    series = compute_historical_series(prices, weights)
+    if isinstance(series, dict):
+        return series
+    return to_json_lists(series)
+
+def compute_historical_series(prices: pd.DataFrame, weights: dict) -> Union[pd.Series, dict]:
+    """
+    Cumulative value of the portfolio (starting at 1) per date, kept as a Series so that
+    callers choose the payload (see services.series). Returns {'error': ...} on failure.
+    """
+    with timed("backtest"):
+        return _historical_performance(prices, weights)
+
+def _historical_performance(prices: pd.DataFrame, weights: dict) -> Union[pd.Series, dict]:
     # Filter prices to only include assets with weights > 0
     valid_tickers = [t for t, w in weights.items() if w > 0 and t in prices.columns]
     if not valid_tickers:
-        print("Warning: No valid tickers for backtest")  # Debug log
+        logger.warning("No valid tickers for backtest")
         return {'error': 'No valid tickers for backtest'}
     
     prices_subset = prices[valid_tickers].dropna()
     
     if prices_subset.empty:
-        print("Warning: prices_subset is empty after dropna")  # Debug log
+        logger.warning("prices_subset is empty after dropna")
         return {'error': 'No valid price data after filtering'}
     
     # Compute daily returns
     returns = prices_subset.pct_change().dropna()
     
     if returns.empty:
-        print(f"Warning: returns is empty (only {len(prices_subset)} rows in subset)")  # Debug log
+        logger.warning("returns is empty (only %d rows in subset)", len(prices_subset))
         return {'error': 'Insufficient data for returns calculation'}
     
-    # Portfolio daily returns (weighted)
-    port_returns = returns.dot(np.array([weights[t] for t in valid_tickers]))
-    
-    # Cumulative returns (assuming starting value of 1)
-    cumulative_returns = (1 + port_returns).cumprod()
+    # Cumulative returns of the weighted portfolio (assuming starting value of 1)
+    backtest = backtest_portfolios(np.array([[weights[t] for t in valid_tickers]]), returns, paths=True)
     
-    result = {
-        'dates': cumulative_returns.index.strftime('%Y-%m-%d').tolist(),
-        'cumulative_returns': cumulative_returns.tolist()
-    }
-    print(f"Success: Generated {len(result['dates'])} performance points")  # Debug log
-    return result
+    series = pd.Series(backtest['values'][0], index=returns.index, name="cumulative_returns")
+    logger.debug("Generated %d performance points", len(series))
+    return series
 
 def compute_efficient_frontier_points(prices: pd.DataFrame, num_points: int = 20) -> list:
     """
     Compute points along the efficient frontier for plotting.
+    Curves are cached per price-data version (see services.frontier).
     Returns: list of {'risk': float, 'return': float}
     """
-    mu = expected_returns.mean_historical_return(prices)
-    S = risk_models.sample_cov(prices)
-    
-    # Compute bounds for volatility range
-    min_vol = 0.05
-    max_vol = 0.30
-    try:
-        ef_min = EfficientFrontier(mu, S)
-        ef_min.min_volatility()
-        _, min_risk, _ = ef_min.portfolio_performance()
-        min_vol = float(min_risk)
-        
-        ef_max = EfficientFrontier(mu, S)
-        ef_max.max_sharpe()  # Use max_sharpe instead of max_return
-        _, max_risk, _ = ef_max.portfolio_performance()
-        max_vol = float(max_risk)
-        if max_vol < 0.30:
-            max_vol = 0.30  # Extend if needed
-        print(f"Frontier bounds: min_vol={min_vol:.4f}, max_vol={max_vol:.4f}")  # Debug log
-    except Exception as e:
-        print(f"Warning: Failed to compute bounds ({e}), using defaults")
-    
-    # Generate points by varying target volatility
-    points = []
-    volatilities = np.linspace(min_vol * 0.9, max_vol * 1.1, num_points)  # Slight buffer
-    success_count = 0
-    for target_vol in volatilities:
-        ef = EfficientFrontier(mu, S)  # NEW: Create fresh ef each iteration
-        try:
-            ef.efficient_risk(target_vol)
-            ret, risk, _ = ef.portfolio_performance()
-            points.append({'risk': float(risk), 'return': float(ret)})
-            success_count += 1
-        except Exception as e:
-            print(f"Skipped vol {target_vol:.4f}: {e}")  # Debug log (comment out in prod)
-            continue
-    
-    print(f"Generated {success_count} frontier points")  # Debug log
-    return points
\ No newline at end of file
+    return frontier_cache.get_points(prices, num_points)
@@ -1,4 +1,26 @@
-from typing import Tuple
+from typing import Mapping, Tuple
+
+import numpy as np
+
+# --- Pondérations (somme = 1.0)
+W_AGE = 0.20
+W_RISK_AV = 0.35
+W_HORIZON = 0.20
+W_REVENU = 0.10
+W_OBJECTIF = 0.10
+W_ESG = -0.05  # ESG réduit légèrement la prise de risque
+
+# Risk aversion (énum "faible", "moyenne", "élevée")
+MAPPING_RISK = {"faible": 2, "moyenne": 1, "élevée": 0}
+
+# Objectif d’investissement
+MAPPING_OBJ = {
+    "croissance agressive": 2,
+    "croissance modérée": 1,
+    "préservation du capital": 0,
+}
+
+PROFILS = np.array(["conservateur", "modéré", "dynamique"], dtype=object)
 
 
 def classify_profile(
@@ -15,14 +37,6 @@ def classify_profile(
     profil : "conservateur", "modéré" ou "dynamique".
     """
 
-    # --- Pondérations (somme = 1.0)
-    W_AGE = 0.20
-    W_RISK_AV = 0.35
-    W_HORIZON = 0.20
-    W_REVENU = 0.10
-    W_OBJECTIF = 0.10
-    W_ESG = -0.05  # ESG réduit légèrement la prise de risque
-
     # 1) Age
     if age < 30:
         score_age = 2
@@ -31,9 +45,8 @@ def classify_profile(
     else:
         score_age = 0
 
-    # 2) Risk aversion (énum "faible", "moyenne", "élevée")
-    mapping_risk = {"faible": 2, "moyenne": 1, "élevée": 0}
-    score_risk_av = mapping_risk.get(risk_aversion.lower(), 1)
+    # 2) Risk aversion
+    score_risk_av = MAPPING_RISK.get(risk_aversion.lower(), 1)
 
     # 3) Horizon (années)
     if horizon > 7:
@@ -52,12 +65,7 @@ def classify_profile(
         score_revenu = 0
 
     # 5) Objectif d’investissement
-    mapping_obj = {
-        "croissance agressive": 2,
-        "croissance modérée": 1,
-        "préservation du capital": 0,
-    }
-    score_obj = mapping_obj.get(objectif.lower(), 1)
+    score_obj = MAPPING_OBJ.get(objectif.lower(), 1)
 
     # 6) Préférence ESG (bonus prudence)
     score_esg = 0
@@ -84,4 +92,57 @@ def classify_profile(
     else:
         profil = "dynamique"
 
-    return risk_score, profil
\ No newline at end of file
+    return risk_score, profil
+
+
+def _map_scores(values, mapping: dict) -> np.ndarray:
+    values = np.asarray(values, dtype=str)
+    scores = np.ones(len(values), dtype=int)
+    matched = np.zeros(len(values), dtype=bool)
+    for key, score in mapping.items():
+        is_key = values == key
+        scores[is_key] = score
+        matched |= is_key
+
+    # Valeurs hors énumération (casse différente...) : traduites une seule fois chacune
+    if not matched.all():
+        distinct, inverse = np.unique(values[~matched], return_inverse=True)
+        scores[~matched] = np.array([mapping.get(value.lower(), 1) for value in distinct])[inverse]
+    return scores
+
+
+def classify_profiles_batch(columns: Mapping[str, object]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Version vectorisée de classify_profile.
+    `columns` : DataFrame ou dict de tableaux age, risk_aversion, horizon, revenu, objectif, esg_preference.
+    Retourne (risk_score, profil) sous forme de tableaux NumPy, identiques au calcul scalaire ligne par ligne.
+    """
+    age = np.asarray(columns["age"])
+    horizon = np.asarray(columns["horizon"])
+    revenu = np.asarray(columns["revenu"], dtype=float)
+    esg_preference = np.asarray(columns["esg_preference"], dtype=bool)
+
+    score_age = np.select([age < 30, age <= 50], [2, 1], default=0)
+    score_risk_av = _map_scores(columns["risk_aversion"], MAPPING_RISK)
+    score_horizon = np.select([horizon > 7, horizon > 3], [2, 1], default=0)
+    score_revenu = np.select([revenu > 80000, revenu > 40000], [2, 1], default=0)
+    score_obj = _map_scores(columns["objectif"], MAPPING_OBJ)
+    score_esg = np.where(esg_preference, -0.5, 0)
+
+    # Même ordre d'addition que le calcul scalaire pour obtenir les mêmes flottants
+    weighted = (
+        score_age * W_AGE
+        + score_risk_av * W_RISK_AV
+        + score_horizon * W_HORIZON
+        + score_revenu * W_REVENU
+        + score_obj * W_OBJECTIF
+        + score_esg * W_ESG
+    )
+    # round() Python (arrondi décimal exact) appliqué aux seules valeurs distinctes :
+    # np.round(x, 2) diffère sur les cas limites comme 1.425
+    distinct, inverse = np.unique(weighted, return_inverse=True)
+    rounded = np.array([round(float(value), 2) for value in distinct])
+    risk_score = np.clip(rounded[inverse], 0.0, 2.0)
+
+    profil = PROFILS[np.searchsorted([0.8, 1.4], risk_score, side="left")]
+    return risk_score, profil
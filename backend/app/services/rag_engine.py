@@ -1,48 +1,236 @@
 # rag_engine.py
+#
+# L'index FAISS est construit hors ligne :
+#     python -m services.rag_engine build
+# puis chargé (memory-mapped) à la première requête ou lors du warm-up. Il n'est jamais
+# construit pendant une requête : s'il manque, le RAG est indisponible jusqu'au build.
+# Un index reconstruit (manifeste réécrit) est rechargé automatiquement par les workers.
 
-from langchain_community.document_loaders import TextLoader
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+import time
 
-# Chargement des documents (exemple : un fichier texte)
-loader = TextLoader("data/faq_investment.txt")  # Modifie ce chemin vers tes docs
-docs = loader.load()
+from services.metrics import cache_lookup, timed
+from services.profiling import PROFILS
 
-# Split des documents en chunks plus petits
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-split_docs = text_splitter.split_documents(docs)
+logger = logging.getLogger(__name__)
 
-# Initialisation des embeddings HuggingFace (modèle léger)
-embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+DOCS_PATH = "data/faq_investment.txt"  # Modifie ce chemin vers tes docs
+INDEX_DIR = os.getenv("RAG_INDEX_DIR", "data/faiss_index")
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+# Délai avant une nouvelle tentative de chargement après un échec
+RAG_RETRY_SECONDS = float(os.getenv("RAG_RETRY_SECONDS", "60"))
+# Intervalle minimal entre deux vérifications du manifeste (index reconstruit ?)
+RAG_CHECK_SECONDS = float(os.getenv("RAG_CHECK_SECONDS", "5"))
+BUILD_COMMAND = "python -m services.rag_engine build"
+
+_state = {"vectordb": None, "version": None, "failed_at": None, "mtime": None, "checked_at": 0.0}
+_lock = threading.Lock()
+
+# Caches liés à la version de l'index : embeddings des requêtes et recommandations
+_query_vectors = {}    # (profile, version) -> embedding
+_recommendations = {}  # (profile, threshold, version) -> texte
+
+
+def source_hash(docs_path: str = DOCS_PATH) -> str:
+    """Empreinte des documents sources et des paramètres qui influencent l'index."""
+    digest = hashlib.sha256()
+    with open(docs_path, "rb") as f:
+        digest.update(f.read())
+    digest.update(f"{EMBEDDING_MODEL}|{CHUNK_SIZE}|{CHUNK_OVERLAP}".encode())
+    return digest.hexdigest()
+
+
+def _load_embeddings():
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    # Initialisation des embeddings HuggingFace (modèle léger)
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
+
+def build_index(index_dir: str = INDEX_DIR, docs_path: str = DOCS_PATH) -> str:
+    """Construit l'index FAISS, l'enregistre sur disque avec son manifeste et retourne sa version."""
+    from langchain_community.document_loaders import TextLoader
+    from langchain_community.vectorstores import FAISS
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    # Chargement des documents et split en chunks plus petits
+    docs = TextLoader(docs_path).load()
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    split_docs = text_splitter.split_documents(docs)
+
+    vectordb = FAISS.from_documents(split_docs, _load_embeddings())
+    vectordb.save_local(index_dir)
+
+    version = source_hash(docs_path)
+    with open(os.path.join(index_dir, "manifest.json"), "w") as f:
+        json.dump({"source_hash": version, "model": EMBEDDING_MODEL, "chunks": len(split_docs)}, f)
+    return version
+
+
+def _manifest_mtime(index_dir: str = INDEX_DIR):
+    try:
+        return os.stat(os.path.join(index_dir, "manifest.json")).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _read_manifest(index_dir: str) -> dict:
+    try:
+        with open(os.path.join(index_dir, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _load_index(index_dir: str = INDEX_DIR):
+    import faiss
+    from langchain_community.vectorstores import FAISS
+
+    manifest = _read_manifest(index_dir)
+    if not manifest:
+        raise FileNotFoundError(f"Index FAISS absent de {index_dir}, lancer `{BUILD_COMMAND}` hors ligne")
+    version = manifest["source_hash"]
+    if version != source_hash():
+        logger.warning("Index FAISS obsolète (documents modifiés), lancer `%s`", BUILD_COMMAND)
+
+    # Index en lecture seule et memory-mapped (IO_FLAG_MMAP_IFC : IO_FLAG_MMAP ne mappe pas
+    # les IndexFlat) : les pages sont partagées entre workers via le cache du noyau
+    index = faiss.read_index(os.path.join(index_dir, "index.faiss"), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    # Fichier produit par build_index, donc de source sûre
+    with open(os.path.join(index_dir, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    return FAISS(_load_embeddings(), index, docstore, index_to_docstore_id), version
+
+
+def _recently_failed() -> bool:
+    failed_at = _state["failed_at"]
+    return failed_at is not None and time.monotonic() - failed_at < RAG_RETRY_SECONDS
+
+
+def _index_changed() -> bool:
+    """Manifeste réécrit depuis le chargement, vérifié au plus toutes les RAG_CHECK_SECONDS secondes."""
+    now = time.monotonic()
+    if now - _state["checked_at"] < RAG_CHECK_SECONDS:
+        return False
+    _state["checked_at"] = now
+    return _manifest_mtime() != _state["mtime"]
+
+
+def get_vectordb():
+    """
+    Base vectorielle chargée paresseusement, rechargée quand l'index est reconstruit.
+    None si le chargement échoue : l'échec est gardé RAG_RETRY_SECONDS secondes, sans
+    nouvelle tentative d'ici là.
+    """
+    if _state["vectordb"] is not None:
+        if _index_changed():
+            logger.info("Index FAISS reconstruit, rechargement")
+            reload_index()
+        return _state["vectordb"]
+    if _recently_failed():
+        return None
+
+    with _lock:
+        if _state["vectordb"] is None:
+            if _recently_failed():
+                return None
+            # Lu avant l'index : un build concurrent sera vu à la prochaine vérification
+            mtime = _manifest_mtime()
+            try:
+                vectordb, version = _load_index()
+            except ImportError as e:
+                _state["failed_at"] = time.monotonic()
+                logger.error("Module manquant pour le RAG: %s", e.name or e)
+                return None
+            except Exception as e:
+                _state["failed_at"] = time.monotonic()
+                logger.error("Erreur de chargement de l'index FAISS: %s", e)
+                return None
+
+            _query_vectors.clear()
+            _recommendations.clear()
+            _state["vectordb"], _state["version"], _state["failed_at"] = vectordb, version, None
+            _state["mtime"], _state["checked_at"] = mtime, time.monotonic()
+            # Pré-calcul des recommandations des trois profils
+            for profile in PROFILS:
+                get_recommendation_for_profile(profile)
+    return _state["vectordb"]
+
+
+def reload_index() -> bool:
+    """Recharge l'index (après un `build`, détecté par get_vectordb) et invalide les caches associés."""
+    with _lock:
+        _state["vectordb"] = None
+        _state["version"] = None
+        _state["failed_at"] = None
+        _query_vectors.clear()
+        _recommendations.clear()
+    return warm_up()
+
+
+def warm_up() -> bool:
+    """Charge le modèle d'embeddings et l'index avant la première requête."""
+    return get_vectordb() is not None
+
+
+def _query_vector(vectordb, profile: str, version: str):
+    key = (profile, version)
+    vector = _query_vectors.get(key)
+    if vector is None:
+        # Enrichir la requête pour améliorer la recherche
+        query = f"Profil investisseur: {profile}"
+        vector = _query_vectors[key] = vectordb.embeddings.embed_query(query)
+    return vector
 
-try:
-    # Création de la base vectorielle FAISS avec les chunks
-    vectordb = FAISS.from_documents(split_docs, embeddings)
-except ImportError:
-    print("Erreur embeddings FAISS: Veuillez installer faiss-cpu ou faiss-gpu")
 
 def get_recommendation_for_profile(profile: str, threshold: float = 1.0) -> str:
-    if 'vectordb' not in globals():
+    vectordb = get_vectordb()
+    if vectordb is None:
         return "La base vectorielle n'est pas initialisée."
 
-    # Enrichir la requête pour améliorer la recherche
-    query = f"Profil investisseur: {profile}"
+    # La réponse ne dépend que de (profil, seuil, version de l'index)
+    version = _state["version"]
+    key = (profile, threshold, version)
+    cached = _recommendations.get(key)
+    cache_lookup("rag", cached is not None)
+    if cached is not None:
+        return cached
 
-    try:
-        results = vectordb.similarity_search_with_score(query, k=3)
-    except Exception:
-        # Fallback si pas supporté
-        results = [(doc, 0) for doc in vectordb.similarity_search(query, k=3)]
+    with timed("rag"):
+        vector = _query_vector(vectordb, profile, version)
+        try:
+            results = vectordb.similarity_search_with_score_by_vector(vector, k=3)
+        except Exception:
+            # Fallback si pas supporté
+            results = [(doc, 0) for doc in vectordb.similarity_search_by_vector(vector, k=3)]
 
-    # Debug : afficher scores dans la console
+    # Debug : scores des documents retenus
     for doc, score in results:
-        print(f"Score: {score:.4f} — Contenu extrait: {doc.page_content[:100]}...")
+        logger.debug("Score: %.4f — Contenu extrait: %s...", score, doc.page_content[:100])
 
     # Filtrer les docs par score (distance faible = plus proche)
     filtered = [doc.page_content.strip() for doc, score in results if score < threshold]
 
-    if not filtered:
-        return "Aucune recommandation trouvée."
+    recommendation = "\n---\n".join(filtered) if filtered else "Aucune recommandation trouvée."
+    _recommendations[key] = recommendation
+    return recommendation
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Construction hors ligne de l'index FAISS")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--docs", default=DOCS_PATH)
+    args = parser.parse_args()
 
-    return "\n---\n".join(filtered)
+    version = build_index(args.index_dir, args.docs)
+    print(f"Index FAISS enregistré dans {args.index_dir} (source_hash={version})")
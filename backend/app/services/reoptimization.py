@@ -0,0 +1,155 @@
+"""
+Batch re-optimisation of every user's portfolio after a market-data update.
+
+A user's portfolio only depends on their profil, as in /submit_profile: the distinct
+profiles are listed first and each is solved once, in a process pool, with the same
+optimisation as the API. Users are then streamed by id pages
+(keyset pagination) and their portfolios upserted in one transaction per page. A checkpoint
+file records the last committed id so an interrupted run resumes where it stopped.
+"""
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+
+from models import User, UserPortfolio
+from services.market_data import market_data
+from services.portfolio_engine import profile_moments, solve_profile_on_moments
+from services.solver_service import disable_solver_service
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 5000
+
+def _solve(profil: str) -> Tuple[str, dict]:
+    # Same moments and solver as the profile portfolios served by the API
+    portfolio = solve_profile_on_moments(profil, *profile_moments(market_data.prices()))
+    weights = {t: float(w) for t, w in portfolio["weights"].items() if w > 0}
+    return profil, {"weights": weights, "performance": tuple(float(x) for x in portfolio["performance"])}
+
+
+def solve_problems(keys: List[str], workers: int = 0) -> Dict[str, dict]:
+    """Solve each distinct profile once, in `workers` processes (0: in this process)."""
+    if workers <= 0 or len(keys) <= 1:
+        return dict(map(_solve, keys))
+    # The job's workers solve inline rather than each starting a solver pool
+    with ProcessPoolExecutor(max_workers=min(workers, len(keys)), initializer=disable_solver_service) as pool:
+        return dict(pool.map(_solve, keys))
+
+
+def distinct_problems(engine: Engine) -> List[str]:
+    with engine.connect() as conn:
+        return sorted(conn.execute(select(User.profil).distinct()).scalars())
+
+
+def iter_user_pages(engine: Engine, after_id: int = 0, page_size: int = PAGE_SIZE) -> Iterator[list]:
+    """Pages of (id, profil) in id order; WHERE id > last seen, no OFFSET."""
+    query = select(User.id, User.profil).order_by(User.id).limit(page_size)
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(query.where(User.id > after_id)).all()
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1].id
+
+
+def _upsert_statement(engine: Engine):
+    """INSERT ... ON CONFLICT (user_id) DO UPDATE, executed with one parameter set per user."""
+    dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(UserPortfolio)
+    columns = {c.name: statement.excluded[c.name] for c in UserPortfolio.__table__.columns if c.name != "user_id"}
+    return statement.on_conflict_do_update(index_elements=[UserPortfolio.user_id], set_=columns)
+
+
+def _read_checkpoint(path: Optional[str], version: str) -> dict:
+    if path and os.path.exists(path):
+        with open(path) as f:
+            checkpoint = json.load(f)
+        # A checkpoint from other market data is stale: start over
+        if checkpoint.get("data_version") == version:
+            return checkpoint
+    return {"data_version": version, "last_id": 0, "processed": 0}
+
+
+def _write_checkpoint(path: Optional[str], checkpoint: dict) -> None:
+    if not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def reoptimize_all(
+    engine: Engine,
+    workers: int = 0,
+    page_size: int = PAGE_SIZE,
+    checkpoint_path: Optional[str] = None,
+    progress: bool = True,
+) -> dict:
+    """
+    Re-optimise and store the portfolio of every user for the current market data.
+    Returns: {'users', 'problems', 'solve_seconds', 'seconds', 'users_per_sec', 'data_version'}
+    """
+    UserPortfolio.__table__.create(engine, checkfirst=True)
+    version = market_data.version
+    checkpoint = _read_checkpoint(checkpoint_path, version)
+    started = time.perf_counter()
+
+    with engine.connect() as conn:
+        total = conn.execute(select(func.count()).select_from(User)).scalar_one()
+    keys = distinct_problems(engine)
+    solutions = solve_problems(keys, workers)
+    solve_seconds = time.perf_counter() - started
+
+    upsert = _upsert_statement(engine)
+    processed = 0
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    for page in iter_user_pages(engine, checkpoint["last_id"], page_size):
+        rows = []
+        for user_id, profil in page:
+            solution = solutions[profil]
+            ret, vol, sharpe = solution["performance"]
+            rows.append({
+                "user_id": user_id,
+                "profil": profil,
+                "constraints": "",
+                "weights": solution["weights"],
+                "expected_return": ret,
+                "volatility": vol,
+                "sharpe": sharpe,
+                "data_version": version,
+                "updated_at": now,
+            })
+        with engine.begin() as conn:
+            conn.execute(upsert, rows)
+
+        processed += len(rows)
+        checkpoint["last_id"] = page[-1].id
+        checkpoint["processed"] += len(rows)
+        _write_checkpoint(checkpoint_path, checkpoint)
+        if progress:
+            elapsed = time.perf_counter() - started
+            logger.info("%d/%d users (%.0f users/sec)", checkpoint["processed"], total, processed / elapsed)
+
+    # Complete run: the next one starts from the first user again
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    seconds = time.perf_counter() - started
+    return {
+        "users": processed,
+        "problems": len(keys),
+        "solve_seconds": solve_seconds,
+        "seconds": seconds,
+        "users_per_sec": processed / seconds if seconds else 0.0,
+        "data_version": version,
+    }
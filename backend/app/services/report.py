@@ -0,0 +1,212 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pandas as pd
+
+# Pool borné dédié au rendu des PDF (matplotlib + reportlab), hors boucle d'événements
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+pdf_executor = ThreadPoolExecutor(max_workers=PDF_WORKERS, thread_name_prefix="pdf")
+# Points de la courbe de performance tracée dans le PDF
+PDF_SERIES_POINTS = int(os.getenv("PDF_SERIES_POINTS", "1000"))
+
+# Figures réutilisées par thread de rendu (backend Agg, sans pyplot ni état global)
+_figures = threading.local()
+
+
+def warm_up() -> None:
+    """Importe matplotlib et reportlab (chargés au premier rendu sinon)."""
+    import matplotlib.backends.backend_agg  # noqa: F401
+    import reportlab.pdfgen.canvas  # noqa: F401
+
+
+def _get_figure(name: str):
+    """Figure Agg propre au thread courant, vidée avant chaque graphique."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figures = getattr(_figures, "figures", None)
+    if figures is None:
+        figures = _figures.figures = {}
+    fig = figures.get(name)
+    if fig is None:
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        figures[name] = fig
+    fig.clear()
+    return fig, fig.add_subplot()
+
+
+def _render_png(fig):
+    """Rendu PNG en mémoire : aucun fichier temporaire partagé entre requêtes."""
+    from reportlab.lib.utils import ImageReader
+
+    image = BytesIO()
+    fig.savefig(image, format="png")
+    image.seek(0)
+    return ImageReader(image)
+
+
+def iter_pdf(buffer: BytesIO, chunk_size: int = 64 * 1024):
+    """Découpe le PDF en blocs pour StreamingResponse (un BytesIO s'itère par lignes)."""
+    return iter(lambda: buffer.read(chunk_size), b"")
+
+
+def generate_pdf_report(user_data):
+    # Bibliothèques de rendu importées au premier PDF : démarrage rapide des workers
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import inch
+    from reportlab.pdfgen import canvas
+
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+
+    # Titre
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(50, height - 50, "Rapport d'Investissement - Robo-Advisor")
+
+    # Informations utilisateur
+    c.setFont("Helvetica", 12)
+    y_position = height - 80
+    c.drawString(50, y_position, f"Profil: {user_data['profil']}")
+    y_position -= 20
+    c.drawString(50, y_position, f"Score de risque: {user_data['risk_score']}")
+    y_position -= 20
+    c.drawString(50, y_position, f"Âge: {user_data['age']}")
+    y_position -= 20
+    c.drawString(50, y_position, f"Revenu: {user_data['revenu']} €")
+    y_position -= 20
+    c.drawString(50, y_position, f"Horizon: {user_data['horizon']} ans")
+    y_position -= 20
+    c.drawString(50, y_position, f"Aversion au risque: {user_data['risk_aversion']}")
+    y_position -= 20
+    c.drawString(50, y_position, f"Objectif: {user_data['objectif']}")
+    y_position -= 20
+    c.drawString(50, y_position, f"Préférence ESG: {'Oui' if user_data['esg_preference'] else 'Non'}")
+
+    # Allocation du portefeuille
+    y_position -= 30
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(50, y_position, "Allocation du portefeuille")
+    y_position -= 20
+    c.setFont("Helvetica", 12)
+    for asset, weight in user_data['portfolio_alloc'].items():
+        if weight > 0:
+            c.drawString(50, y_position, f"{asset}: {(weight * 100):.2f}%")
+            y_position -= 20
+
+    # Générer et ajouter le graphique en camembert
+    y_position -= 30
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(50, y_position, "Graphique d'allocation")
+    y_position -= 220
+
+    # Créer le graphique en camembert avec matplotlib
+    labels = [asset for asset, weight in user_data['portfolio_alloc'].items() if weight > 0]
+    sizes = [weight * 100 for weight in user_data['portfolio_alloc'].values() if weight > 0]
+    fig, ax = _get_figure("pie")
+    ax.pie(sizes, labels=labels, autopct='%1.1f%%')
+    ax.set_title("Allocation du portefeuille")
+
+    # Ajouter le graphique au PDF
+    c.drawImage(_render_png(fig), 50, y_position, width=3*inch, height=3*inch)
+
+    # Ajouter la performance simulée (si disponible)
+    if user_data['sim_performance'] and not user_data['sim_performance'].get('error'):
+        y_position -= 250
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(50, y_position, "Performance simulée historique")
+        y_position -= 220
+
+        # Créer le graphique de performance
+        fig, ax = _get_figure("line")
+        # Axe temporel plutôt que 1000+ étiquettes catégorielles (rendu beaucoup plus rapide)
+        ax.plot(pd.to_datetime(user_data['sim_performance']['dates']), user_data['sim_performance']['cumulative_returns'])
+        ax.set_title("Performance simulée (Rendement Cumulé)")
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Rendement")
+
+        # Ajouter au PDF
+        c.drawImage(_render_png(fig), 50, y_position, width=3*inch, height=3*inch)
+
+    # Ajouter la frontière efficiente (si disponible)
+    if user_data['frontier_points'] and len(user_data['frontier_points']) > 0:
+        y_position -= 250
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(50, y_position, "Frontière efficiente")
+        y_position -= 220
+
+        # Créer le graphique de la frontière
+        fig, ax = _get_figure("frontier")
+        risks = [point['risk'] for point in user_data['frontier_points']]
+        returns = [point['return'] for point in user_data['frontier_points']]
+        ax.plot(risks, returns, label="Frontière efficiente")
+        ax.scatter([user_data['user_point']['risk']], [user_data['user_point']['return']], color='orange', label="Votre portefeuille")
+        ax.set_title("Frontière efficiente : Risque vs Rendement")
+        ax.set_xlabel("Risque (%)")
+        ax.set_ylabel("Rendement (%)")
+        ax.legend()
+
+        # Ajouter au PDF
+        c.drawImage(_render_png(fig), 50, y_position, width=3*inch, height=3*inch)
+
+    # Recommandation
+    y_position -= 30
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(50, y_position, "Recommandation")
+    y_position -= 20
+    c.setFont("Helvetica", 12)
+    text = c.beginText(50, y_position)
+    for line in user_data['recommendation'].split('\n'):
+        text.textLine(line)
+    c.drawText(text)
+
+    # Indicateurs de risque (si disponibles), sur une page dédiée
+    risk = user_data.get('risk')
+    if risk:
+        c.showPage()
+        c.setFont("Helvetica-Bold", 14)
+        y_position = height - 50
+        c.drawString(50, y_position, "Indicateurs de risque")
+        y_position -= 25
+        c.setFont("Helvetica", 12)
+        level = f"{risk['confidence'] * 100:.0f}%, {risk['horizon_days']} jour(s)"
+        for line in [
+            f"Volatilité annualisée: {risk['annual_volatility'] * 100:.2f}%",
+            f"VaR historique ({level}): {risk['historical_var'] * 100:.2f}%",
+            f"CVaR historique ({level}): {risk['historical_cvar'] * 100:.2f}%",
+            f"VaR paramétrique ({level}): {risk['parametric_var'] * 100:.2f}%",
+            f"CVaR paramétrique ({level}): {risk['parametric_cvar'] * 100:.2f}%",
+            f"Perte maximale: {risk['max_drawdown'] * 100:.2f}% "
+            f"({risk['max_drawdown_peak'] or 'début'} → {risk['max_drawdown_trough'] or 'début'})",
+            f"Durée maximale sous le plus haut: {risk['max_drawdown_duration']} jours de bourse",
+        ]:
+            c.drawString(50, y_position, line)
+            y_position -= 20
+
+        # Contributions au risque, des plus fortes aux plus faibles
+        y_position -= 10
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(50, y_position, "Contributions au risque")
+        y_position -= 20
+        c.setFont("Helvetica", 12)
+        contributions = sorted(risk['risk_contributions'].items(), key=lambda item: -item[1]['percent'])
+        for asset, contribution in contributions[:10]:
+            c.drawString(50, y_position, f"{asset}: {contribution['percent'] * 100:.2f}%")
+            y_position -= 20
+
+        # Volatilité glissante
+        y_position -= 230
+        fig, ax = _get_figure("rolling")
+        ax.plot(pd.to_datetime(risk['rolling']['dates']), risk['rolling']['volatility'])
+        ax.set_title("Volatilité glissante (annualisée)")
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Volatilité")
+        c.drawImage(_render_png(fig), 50, y_position, width=3*inch, height=3*inch)
+
+    c.showPage()
+    c.save()
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,255 @@
+"""
+Risk analytics of one or many fixed-weight portfolios over the cached daily returns matrix:
+historical and parametric (Gaussian) VaR / CVaR, maximum drawdown and its duration,
+rolling volatility and beta, and per-asset contributions to volatility.
+
+Portfolios are rows of a (P, N) weights matrix and every metric is computed for all of
+them at once. Order statistics use np.partition (linear time); rolling windows and
+drawdowns use cumulative sums / maxima, so each metric is O(T) per portfolio with no
+Python loop over dates or portfolios.
+"""
+from statistics import NormalDist
+from typing import Mapping, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from services.backtest import TRADING_DAYS, weights_matrix
+from services.large_universe import LowRankCovariance
+from services.market_data import market_data
+
+Weights = Union[Mapping[str, float], Sequence[Mapping[str, float]], np.ndarray]
+
+
+def _weights(weights: Weights, tickers: Sequence[str]) -> np.ndarray:
+    """(P, N) weights matrix; rejects tickers outside the universe and empty portfolios."""
+    if isinstance(weights, np.ndarray):
+        matrix = np.atleast_2d(weights).astype(float)
+    else:
+        portfolios = [weights] if isinstance(weights, Mapping) else weights
+        unknown = sorted({ticker for portfolio in portfolios for ticker in portfolio} - set(tickers))
+        if unknown:
+            raise ValueError(f"Unknown tickers: {', '.join(unknown)}")
+        matrix = weights_matrix(portfolios, tickers)
+    empty = np.flatnonzero(matrix.sum(axis=1) == 0)
+    if len(empty):
+        raise ValueError(f"Weights of portfolio(s) {', '.join(map(str, empty))} sum to zero")
+    return matrix
+
+
+def portfolio_returns(weights: np.ndarray, returns: np.ndarray) -> np.ndarray:
+    """(P, T) daily returns of portfolios held at constant weights (rebalanced daily)."""
+    return np.atleast_2d(weights) @ returns.T
+
+
+def horizon_returns(daily: np.ndarray, horizon: int = 1) -> np.ndarray:
+    """Overlapping `horizon`-day compounded returns of (P, T) daily returns, from cumulative log sums."""
+    if horizon <= 1:
+        return daily
+    log_growth = np.zeros((daily.shape[0], daily.shape[1] + 1))
+    np.cumsum(np.log1p(daily), axis=1, out=log_growth[:, 1:])
+    return np.expm1(log_growth[:, horizon:] - log_growth[:, :-horizon])
+
+
+def historical_var_cvar(returns: np.ndarray, confidence: float = 0.95):
+    """
+    Historical VaR and CVaR (expected shortfall) of (P, T) returns, as positive losses.
+    VaR is the k-th smallest return with k = ceil((1 - confidence) * T); CVaR the mean
+    of the k smallest. Returns: (var (P,), cvar (P,))
+    """
+    returns = np.atleast_2d(returns)
+    k = max(int(np.ceil((1.0 - confidence) * returns.shape[1])), 1)
+    tail = np.partition(returns, k - 1, axis=1)[:, :k]
+    return -tail.max(axis=1), -tail.mean(axis=1)
+
+
+def parametric_var_cvar(mean: np.ndarray, std: np.ndarray, confidence: float = 0.95):
+    """Gaussian VaR and CVaR from the mean and standard deviation of returns. Returns: (var, cvar)"""
+    normal = NormalDist()
+    z = normal.inv_cdf(1.0 - confidence)
+    var = -(mean + z * std)
+    cvar = -(mean - std * normal.pdf(z) / (1.0 - confidence))
+    return var, cvar
+
+
+def drawdowns(values: np.ndarray) -> dict:
+    """
+    Maximum drawdown of (P, T) value paths starting from a capital of 1, its peak and
+    trough dates (indices, the peak is -1 for the initial capital), and the longest time
+    under water (dates from a peak until it is regained, or until the end).
+    Returns: {'max_drawdown', 'peak', 'trough', 'max_duration'}, each of shape (P,)
+    """
+    values = np.atleast_2d(values)
+    # Initial capital as date 0, so that a loss on the first date counts as a drawdown
+    values = np.concatenate([np.ones((values.shape[0], 1)), values], axis=1)
+    dates = np.arange(values.shape[1])
+    running_max = np.maximum.accumulate(values, axis=1)
+    drawdown = values / running_max - 1.0
+    trough = drawdown.argmin(axis=1)
+
+    # Index of the last running peak at or before each date
+    last_peak = np.maximum.accumulate(np.where(values >= running_max, dates, 0), axis=1)
+    rows = np.arange(values.shape[0])
+    return {
+        "max_drawdown": drawdown[rows, trough],
+        "peak": last_peak[rows, trough] - 1,
+        "trough": trough - 1,
+        "max_duration": (dates - last_peak).max(axis=1),
+    }
+
+
+def _rolling_sum(x: np.ndarray, window: int) -> np.ndarray:
+    """Sums over trailing windows along the last axis (length T - window + 1)."""
+    cumulative = np.zeros(x.shape[:-1] + (x.shape[-1] + 1,))
+    np.cumsum(x, axis=-1, out=cumulative[..., 1:])
+    return cumulative[..., window:] - cumulative[..., :-window]
+
+
+def rolling_volatility(returns: np.ndarray, window: int = 63, frequency: int = TRADING_DAYS) -> np.ndarray:
+    """Annualised volatility over trailing windows of (P, T) returns: (P, T - window + 1)."""
+    returns = np.atleast_2d(returns)
+    # Centred on the full-sample mean: keeps the sum-of-squares difference well conditioned
+    centred = returns - returns.mean(axis=1, keepdims=True)
+    s1 = _rolling_sum(centred, window)
+    s2 = _rolling_sum(centred ** 2, window)
+    variance = np.maximum((s2 - s1 ** 2 / window) / (window - 1), 0.0)
+    return np.sqrt(variance * frequency)
+
+
+def rolling_beta(returns: np.ndarray, benchmark: np.ndarray, window: int = 63) -> np.ndarray:
+    """Beta of (P, T) returns on a (T,) benchmark over trailing windows: (P, T - window + 1)."""
+    returns = np.atleast_2d(returns)
+    x = benchmark - benchmark.mean()
+    y = returns - returns.mean(axis=1, keepdims=True)
+    sx, sxx = _rolling_sum(x, window), _rolling_sum(x * x, window)
+    sy, sxy = _rolling_sum(y, window), _rolling_sum(y * x, window)
+    covariance = sxy - sx * sy / window
+    variance = sxx - sx ** 2 / window
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(variance > 0, covariance / variance, np.nan)
+
+
+def risk_contributions(weights: np.ndarray, cov) -> dict:
+    """
+    Euler decomposition of volatility: RC_i = w_i (S w)_i / sigma, summing to sigma.
+    cov: dense (N, N) covariance or LowRankCovariance.
+    Returns: {'volatility' (P,), 'contributions' (P, N), 'percent' (P, N)}
+    """
+    weights = np.atleast_2d(weights)
+    if isinstance(cov, LowRankCovariance):
+        marginal = (weights @ cov.factors) @ cov.factors.T + weights * cov.diag
+    else:
+        marginal = weights @ np.asarray(cov, dtype=float)
+    variance = np.einsum("pn,pn->p", weights, marginal)
+    volatility = np.sqrt(np.maximum(variance, 0.0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        contributions = weights * marginal / volatility[:, None]
+        percent = contributions / volatility[:, None]
+    return {"volatility": volatility, "contributions": contributions, "percent": percent}
+
+
+def risk_metrics(
+    weights: Weights,
+    returns: Optional[pd.DataFrame] = None,
+    cov=None,
+    confidence: float = 0.95,
+    horizon: int = 1,
+    window: int = 63,
+    benchmark: Optional[Union[str, np.ndarray]] = None,
+) -> dict:
+    """
+    Every risk metric of one portfolio (dict of weights) or a batch (list of dicts, or a
+    (P, N) matrix aligned on the returns columns), over the cached returns by default.
+    VaR / CVaR are `horizon`-day losses at `confidence`. benchmark of the rolling beta: a
+    ticker or a (T,) return array, the equal-weighted universe by default. cov: annualised
+    covariance for the risk contributions (the cached profile moments with the cached
+    returns, else the sample covariance of `returns`).
+    Returns: dict of arrays with one row per portfolio (see the keys below)
+    """
+    cached = returns is None
+    if cached:
+        returns = market_data.returns()
+    matrix = returns.to_numpy(dtype=float)
+    T, N = matrix.shape
+    if T <= max(window, horizon):
+        raise ValueError(f"Not enough returns ({T}) for a {window}-day window")
+    W = _weights(weights, returns.columns)
+    if W.shape[1] != N:
+        raise ValueError(f"Weights of shape {W.shape} do not match returns of shape {(T, N)}")
+
+    daily = portfolio_returns(W, matrix)
+    period = horizon_returns(daily, horizon)
+    historical_var, historical_cvar = historical_var_cvar(period, confidence)
+    # Gaussian horizon moments from the daily ones (i.i.d. returns)
+    mean, std = daily.mean(axis=1) * horizon, daily.std(axis=1, ddof=1) * np.sqrt(horizon)
+    parametric_var, parametric_cvar = parametric_var_cvar(mean, std, confidence)
+
+    values = np.exp(np.cumsum(np.log1p(daily), axis=1))
+    if benchmark is None:
+        benchmark = matrix.mean(axis=1)
+    elif isinstance(benchmark, str):
+        if benchmark not in returns.columns:
+            raise ValueError(f"Unknown benchmark: {benchmark}")
+        benchmark = matrix[:, returns.columns.get_loc(benchmark)]
+    if cov is None and cached:
+        from services.portfolio_engine import profile_moments
+        cov = profile_moments(market_data.prices())[1]
+    elif cov is None:
+        cov = np.cov(matrix, rowvar=False) * TRADING_DAYS
+
+    return {
+        "dates": returns.index,
+        "window_dates": returns.index[window - 1:],
+        "confidence": confidence,
+        "horizon": horizon,
+        "annual_volatility": std / np.sqrt(horizon) * np.sqrt(TRADING_DAYS),
+        "historical_var": historical_var,
+        "historical_cvar": historical_cvar,
+        "parametric_var": parametric_var,
+        "parametric_cvar": parametric_cvar,
+        **drawdowns(values),
+        "rolling_volatility": rolling_volatility(daily, window),
+        "rolling_beta": rolling_beta(daily, benchmark, window),
+        "tickers": list(returns.columns),
+        **risk_contributions(W, cov),
+    }
+
+
+def _date(dates: pd.DatetimeIndex, index: int) -> Optional[str]:
+    """Date of a drawdown index, None for the initial capital (before the first date)."""
+    return dates[index].strftime("%Y-%m-%d") if index >= 0 else None
+
+
+def risk_report(metrics: dict, index: int = 0, points: int = 250) -> dict:
+    """
+    JSON-ready report of one portfolio of risk_metrics(): scalar metrics, dates of the
+    worst drawdown (peak None when it is the initial capital), non-zero risk
+    contributions and rolling series sampled to `points`.
+    """
+    dates = metrics["dates"]
+    window_dates = metrics["window_dates"]
+    sample = np.unique(np.linspace(0, len(window_dates) - 1, min(points, len(window_dates))).round().astype(int))
+    contributions = {
+        ticker: {"contribution": float(c), "percent": float(p)}
+        for ticker, c, p in zip(metrics["tickers"], metrics["contributions"][index], metrics["percent"][index])
+        if c != 0 and np.isfinite(c)
+    }
+    return {
+        "confidence": metrics["confidence"],
+        "horizon_days": metrics["horizon"],
+        "annual_volatility": float(metrics["annual_volatility"][index]),
+        "historical_var": float(metrics["historical_var"][index]),
+        "historical_cvar": float(metrics["historical_cvar"][index]),
+        "parametric_var": float(metrics["parametric_var"][index]),
+        "parametric_cvar": float(metrics["parametric_cvar"][index]),
+        "max_drawdown": float(metrics["max_drawdown"][index]),
+        "max_drawdown_peak": _date(dates, metrics["peak"][index]),
+        "max_drawdown_trough": _date(dates, metrics["trough"][index]),
+        "max_drawdown_duration": int(metrics["max_duration"][index]),
+        "risk_contributions": contributions,
+        "rolling": {
+            "dates": window_dates[sample].strftime("%Y-%m-%d").tolist(),
+            "volatility": metrics["rolling_volatility"][index][sample].tolist(),
+            "beta": np.nan_to_num(metrics["rolling_beta"][index][sample]).tolist(),
+        },
+    }
@@ -0,0 +1,150 @@
+"""
+Payloads of time series (historical performance) for the API.
+
+- Downsampling to a requested point count, keeping the visual shape:
+  LTTB (largest triangle three buckets) or min/max bucketing (keeps every extreme).
+- Compact encoding: start date plus either a regular frequency or int32 offsets, and the
+  values as little-endian float32, both base64 encoded (about 3x smaller than JSON lists,
+  and no per-point string formatting).
+- Pages of the full-resolution series.
+"""
+import base64
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+ENCODINGS = ("json", "base64")
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets: the first and last points,
+    then in each bucket the point forming the largest triangle with the previously kept
+    point and the average of the next bucket.
+    """
+    n = len(y)
+    if n_out >= n or n <= 2:
+        return np.arange(n)
+    if n_out <= 2:
+        return np.array([0, n - 1])
+
+    # n_out - 2 buckets over the inner points 1 .. n-2
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        area = np.abs(
+            (x[previous] - avg_x) * (y[lo:hi] - y[previous])
+            - (x[previous] - x[lo:hi]) * (avg_y - y[previous])
+        )
+        previous = lo + int(np.argmax(area))
+        selected[i + 1] = previous
+    return selected
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the minimum and maximum of (n_out - 2) // 2 equal buckets, plus both ends."""
+    n = len(y)
+    if n_out >= n or n <= 2:
+        return np.arange(n)
+    n_buckets = max((n_out - 2) // 2, 1)
+    bucket = np.arange(n) * n_buckets // n
+    order = np.lexsort((y, bucket))
+    # Within each bucket (sorted by value): first = minimum, last = maximum
+    starts = np.searchsorted(bucket[order], np.arange(n_buckets))
+    ends = np.r_[starts[1:], n] - 1
+    return np.unique(np.concatenate(([0, n - 1], order[starts], order[ends])))
+
+
+def downsample(series: pd.Series, points: int, method: str = "lttb") -> pd.Series:
+    """`series` reduced to at most `points` points (exactly `points` with LTTB)."""
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    if points >= len(series):
+        return series
+    values = series.to_numpy(dtype=float)
+    if method == "lttb":
+        x = series.index.asi8.astype(float)
+        indices = lttb_indices(x, values, points)
+    else:
+        indices = minmax_indices(values, points)
+    return series.iloc[indices]
+
+
+def _b64(array: np.ndarray) -> str:
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode("ascii")
+
+
+def encode_base64(series: pd.Series) -> dict:
+    """
+    Compact form: {'encoding', 'start', 'count', 'freq' or ('offsets', 'offset_unit'), 'values'}.
+    Dates are start + freq periods when the index is regular, else start + int32 offsets
+    (days, or seconds for intraday data). Values are little-endian float32.
+    """
+    index = pd.DatetimeIndex(series.index)
+    payload = {"encoding": "base64", "count": len(series)}
+    if len(index):
+        intraday = bool((index != index.normalize()).any())
+        payload["start"] = index[0].isoformat() if intraday else index[0].strftime("%Y-%m-%d")
+        freq = pd.infer_freq(index) if len(index) >= 3 else None
+        if freq is not None:
+            payload["freq"] = freq
+        else:
+            unit = "s" if intraday else "D"
+            offsets = (index - index[0]) // pd.Timedelta(1, unit=unit)
+            payload["offset_unit"] = unit
+            payload["offsets"] = _b64(np.asarray(offsets, dtype="<i4"))
+    payload["values"] = _b64(series.to_numpy(dtype="<f4"))
+    return payload
+
+
+def to_json_lists(series: pd.Series) -> dict:
+    """Historical format: {'dates': ['%Y-%m-%d', ...], 'cumulative_returns': [...]}."""
+    return {
+        "dates": pd.DatetimeIndex(series.index).strftime("%Y-%m-%d").tolist(),
+        "cumulative_returns": series.to_numpy(dtype=float).tolist(),
+    }
+
+
+def encode(series: pd.Series, encoding: str = "json") -> dict:
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding: {encoding}")
+    return encode_base64(series) if encoding == "base64" else to_json_lists(series)
+
+
+def performance_payload(
+    performance: Union[pd.Series, dict],
+    points: Optional[int] = None,
+    method: str = "lttb",
+    encoding: str = "json",
+) -> dict:
+    """
+    Response body of a performance series, optionally downsampled to `points`.
+    Errors ({'error': ...}) are passed through unchanged.
+    """
+    if isinstance(performance, dict):
+        return performance
+    series = downsample(performance, points, method) if points else performance
+    payload = encode(series, encoding)
+    if len(series) != len(performance):
+        payload["downsampled"] = {"method": method, "points": len(series), "total": len(performance)}
+    return payload
+
+
+def page(series: pd.Series, offset: int = 0, limit: int = 5000, encoding: str = "json") -> dict:
+    """One page of the full-resolution series, with the offset of the next page (None at the end)."""
+    chunk = series.iloc[offset:offset + limit]
+    end = offset + len(chunk)
+    return {
+        "total": len(series),
+        "offset": offset,
+        "limit": limit,
+        "next_offset": end if end < len(series) else None,
+        **encode(chunk, encoding),
+    }
@@ -0,0 +1,53 @@
+"""
+Single-flight deduplication: concurrent calls with the same key share one execution.
+
+The first caller of a key (the leader) runs the function; callers arriving while it is
+in flight wait for it and receive the same result, or the same exception. Nothing is
+cached: once the call completes, the next caller of the key runs it again.
+"""
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Tuple, TypeVar
+
+from services.metrics import COALESCED_REQUESTS, SINGLEFLIGHT_EXECUTIONS
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        Run fn() once for all concurrent callers of `key`.
+        Returns: (result, shared), shared being True for callers that waited on a leader
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            COALESCED_REQUESTS.inc(group=self.name)
+            return call.result(), True
+
+        SINGLEFLIGHT_EXECUTIONS.inc(group=self.name)
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
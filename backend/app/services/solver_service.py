@@ -0,0 +1,287 @@
+"""
+Solver service: runs the cvxpy optimisations (profile portfolios, frontier sweeps) in a
+bounded process pool, so that request threads only wait on futures instead of holding
+the GIL during solves.
+
+- Backpressure: at most SOLVER_MAX_PENDING solves are queued or running; beyond that
+  submit() raises SolverSaturated (mapped to HTTP 503 by the API).
+- Timeouts: result() gives up after SOLVER_TIMEOUT seconds and cancels the solve if it has
+  not started yet. A solve already running in a worker cannot be interrupted: it runs to
+  completion, its result is discarded, and it keeps its slot until then.
+- Shared memory: (mu, S) are published once per data version in shared memory blocks;
+  tasks only carry a small MomentsRef and workers map the blocks (once per version).
+
+SOLVER_WORKERS=0 disables the pool: solves then run inline, as before. Child processes
+(solver workers, the batch job's pool) never delegate either: each would start a nested
+pool of its own, and daemonic pool workers cannot have children.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.large_universe import LowRankCovariance
+from services.metrics import (
+    SOLVER_SERVICE_REJECTIONS,
+    SOLVER_SERVICE_TIMEOUTS,
+    capture_solves,
+    observe_solve,
+    timed,
+)
+
+logger = logging.getLogger(__name__)
+
+SOLVER_WORKERS = int(os.getenv("SOLVER_WORKERS", "2"))
+SOLVER_MAX_PENDING = int(os.getenv("SOLVER_MAX_PENDING", "8"))
+SOLVER_TIMEOUT = float(os.getenv("SOLVER_TIMEOUT", "30"))
+# "spawn": workers do not inherit the web server's threads and locks
+SOLVER_START_METHOD = os.getenv("SOLVER_START_METHOD", "spawn")
+# Data versions whose moments stay published (older blocks are unlinked)
+SHARED_VERSIONS = 2
+
+
+class SolverError(RuntimeError):
+    """Base class of the solver-service failures (not infeasibility, which stays a ValueError)."""
+
+
+class SolverSaturated(SolverError):
+    """Too many solves queued: the caller should retry later."""
+
+
+class SolverTimeout(SolverError):
+    """A solve did not complete within its timeout."""
+
+
+class MomentsRef(NamedTuple):
+    """Picklable handle on moments published in shared memory."""
+    key: str
+    tickers: Tuple[str, ...]
+    low_rank: bool
+    blocks: Tuple[Tuple[str, Tuple[int, ...]], ...]  # (shared memory name, float64 shape)
+
+
+class SharedMoments:
+    """Parent side: publishes (mu, S) per key, keeping the last `keep` keys alive."""
+
+    def __init__(self, keep: int = SHARED_VERSIONS):
+        self.keep = keep
+        self._published: "OrderedDict[str, Tuple[MomentsRef, List[shared_memory.SharedMemory]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def publish(self, key: str, mu: pd.Series, S) -> MomentsRef:
+        with self._lock:
+            published = self._published.get(key)
+            if published is not None:
+                return published[0]
+
+            low_rank = isinstance(S, LowRankCovariance)
+            arrays = [mu.to_numpy(dtype=float)]
+            arrays += [S.factors, S.diag] if low_rank else [np.asarray(S, dtype=float)]
+            segments, blocks = [], []
+            for array in arrays:
+                segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                np.ndarray(array.shape, dtype=np.float64, buffer=segment.buf)[...] = array
+                segments.append(segment)
+                blocks.append((segment.name, array.shape))
+            ref = MomentsRef(key, tuple(mu.index), low_rank, tuple(blocks))
+            self._published[key] = (ref, segments)
+
+            while len(self._published) > self.keep:
+                _, (_, old) = self._published.popitem(last=False)
+                _release(old)
+            return ref
+
+    def close(self) -> None:
+        with self._lock:
+            for _, segments in self._published.values():
+                _release(segments)
+            self._published.clear()
+
+
+def _release(segments: Iterable[shared_memory.SharedMemory]) -> None:
+    # Workers that mapped a block keep their mapping; unlink only removes the name
+    for segment in segments:
+        segment.close()
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# Worker side: mapped moments, per key
+_attached: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def attach_moments(ref: MomentsRef):
+    """(mu, S) of a MomentsRef, as views on the shared blocks (mapped once per worker)."""
+    attached = _attached.get(ref.key)
+    if attached is None:
+        segments = [shared_memory.SharedMemory(name=name) for name, _ in ref.blocks]
+        arrays = [np.ndarray(shape, dtype=np.float64, buffer=s.buf) for s, (_, shape) in zip(segments, ref.blocks)]
+        mu = pd.Series(arrays[0], index=list(ref.tickers), copy=False)
+        if ref.low_rank:
+            S = LowRankCovariance(arrays[1], arrays[2])
+        else:
+            S = pd.DataFrame(arrays[1], index=mu.index, columns=mu.index, copy=False)
+        attached = _attached[ref.key] = (segments, mu, S)
+        while len(_attached) > SHARED_VERSIONS:
+            _attached.popitem(last=False)
+    return attached[1], attached[2]
+
+
+def _init_worker() -> None:
+    # Solver stack imported once per worker, not on its first solve
+    import cvxpy  # noqa: F401
+    import pypfopt  # noqa: F401
+
+
+def _run(fn: Callable, *args):
+    """Worker entry point: the task's result and the solver statistics it recorded."""
+    with capture_solves() as solves:
+        result = fn(*args)
+    return result, solves
+
+
+def profile_task(ref: MomentsRef, profil: str) -> dict:
+    from services.portfolio_engine import solve_profile_on_moments
+    mu, S = attach_moments(ref)
+    return solve_profile_on_moments(profil, mu, S)
+
+
+_sweeps: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def frontier_task(ref: MomentsRef, num_points: int) -> list:
+    from services.frontier import build_sweep
+    sweep = _sweeps.get(ref.key)
+    if sweep is None:
+        # The canonicalised problem is reused for every point count of this version
+        sweep = _sweeps[ref.key] = build_sweep(*attach_moments(ref))
+        while len(_sweeps) > SHARED_VERSIONS:
+            _sweeps.popitem(last=False)
+    problem, (low, high) = sweep
+    return problem.sweep(np.linspace(low, high, num_points))
+
+
+class SolverService:
+    def __init__(
+        self,
+        workers: int = SOLVER_WORKERS,
+        max_pending: int = SOLVER_MAX_PENDING,
+        timeout: float = SOLVER_TIMEOUT,
+        start_method: str = SOLVER_START_METHOD,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.start_method = start_method
+        self.moments = SharedMoments()
+        self._slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        # Only the main process delegates: child processes solve inline
+        return self.workers > 0 and multiprocessing.parent_process() is None
+
+    def disable(self) -> None:
+        """Solve inline from now on in this process."""
+        self.workers = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_init_worker,
+                )
+            return self._executor
+
+    def _reset_pool(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def publish(self, key: str, mu: pd.Series, S) -> MomentsRef:
+        return self.moments.publish(key, mu, S)
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Queue fn(*args) in the pool. Raises SolverSaturated when max_pending solves are in flight."""
+        if not self._slots.acquire(blocking=False):
+            SOLVER_SERVICE_REJECTIONS.inc()
+            raise SolverSaturated(f"{self.max_pending} solves already in flight")
+        try:
+            try:
+                future = self._pool().submit(_run, fn, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory): start a fresh pool
+                logger.warning("Solver pool broken, restarting it")
+                self._reset_pool()
+                future = self._pool().submit(_run, fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Cancelled, failed or done: the slot is free again
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def result(self, future: Future, timeout: Optional[float] = None):
+        """Wait for a submitted solve (SolverTimeout after `timeout` seconds, cancelling it if queued)."""
+        try:
+            with timed("solver_service"):
+                result, solves = future.result(self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            future.cancel()
+            SOLVER_SERVICE_TIMEOUTS.inc()
+            raise SolverTimeout(f"Solve did not complete within {self.timeout if timeout is None else timeout:g}s")
+        except CancelledError:
+            raise SolverTimeout("Solve cancelled")
+        except BrokenProcessPool as e:
+            self._reset_pool()
+            raise SolverError(f"Solver pool failure: {e}")
+        for solve in solves:
+            observe_solve(*solve)
+        return result
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        return self.result(self.submit(fn, *args), timeout)
+
+    def run_many(self, fn: Callable, calls: List[tuple], timeout: Optional[float] = None) -> list:
+        """Run fn on each argument tuple in parallel, within one overall timeout; all or nothing."""
+        futures: List[Future] = []
+        try:
+            for args in calls:
+                futures.append(self.submit(fn, *args))
+            deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+            return [self.result(f, max(deadline - time.monotonic(), 0.0)) for f in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def shutdown(self) -> None:
+        self._reset_pool()
+        self.moments.close()
+
+
+solver_service = SolverService()
+atexit.register(solver_service.moments.close)
+
+
+def disable_solver_service() -> None:
+    """Initializer of the other process pools: their workers solve inline."""
+    solver_service.disable()
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+from typing import List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database import AsyncSessionLocal
+from models import User
+
+logger = logging.getLogger(__name__)
+
+USER_BATCH_SIZE = int(os.getenv("USER_BATCH_SIZE", "200"))
+# Longest wait for more users before a partial batch is written (seconds)
+USER_FLUSH_INTERVAL = float(os.getenv("USER_FLUSH_INTERVAL", "0.05"))
+USER_QUEUE_SIZE = int(os.getenv("USER_QUEUE_SIZE", "10000"))
+
+
+class UserWriter:
+    """
+    Write-behind persistence of users: requests queue the row and return at once, a
+    background task inserts the queued rows in batches (one multi-row INSERT per batch).
+    submit() returns a future resolved with the new id, or with the error of that row.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        batch_size: int = USER_BATCH_SIZE,
+        flush_interval: float = USER_FLUSH_INTERVAL,
+        max_queue: int = USER_QUEUE_SIZE,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Write everything still queued, then stop the background task."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    def submit(self, values: dict) -> "asyncio.Future[int]":
+        """Queue a users row. Raises asyncio.QueueFull when the writer is saturated."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((values, future))
+        return future
+
+    async def _next_batch(self) -> Tuple[List[tuple], bool]:
+        """Up to batch_size rows, waiting at most flush_interval after the first one."""
+        first = await self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = asyncio.get_running_loop().time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            try:
+                item = self._queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self._queue.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._next_batch()
+            if batch:
+                await self._write(batch)
+
+    async def _insert(self, rows: List[dict]) -> List[int]:
+        async with self.session_factory() as session:
+            result = await session.execute(insert(User).returning(User.id, sort_by_parameter_order=True), rows)
+            ids = list(result.scalars())
+            await session.commit()
+            return ids
+
+    async def _write(self, batch: List[tuple]) -> None:
+        try:
+            ids = await self._insert([values for values, _ in batch])
+        except IntegrityError:
+            # One bad row (e.g. duplicate email) must not drop the others: retry them one by one
+            for values, future in batch:
+                try:
+                    self._resolve(future, (await self._insert([values]))[0])
+                except Exception as e:
+                    self._fail(future, e)
+            return
+        except Exception as e:
+            for _, future in batch:
+                self._fail(future, e)
+            return
+        for (_, future), user_id in zip(batch, ids):
+            self._resolve(future, user_id)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, user_id: int) -> None:
+        if not future.done():
+            future.set_result(user_id)
+
+    @staticmethod
+    def _fail(future: asyncio.Future, error: Exception) -> None:
+        if not future.done():
+            future.set_exception(error)
+            future.exception()  # reported here: callers may not await the future
+        logger.warning("User not saved (%s)", error)
+
+
+user_writer = UserWriter(AsyncSessionLocal)
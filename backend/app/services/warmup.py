@@ -0,0 +1,141 @@
+"""
+Worker warm-up: loads the market data, moments, profile portfolios, frontier, RAG index
+and PDF libraries before traffic is accepted, so the first requests are not slow.
+
+Heavy libraries (pypfopt/cvxpy, matplotlib/reportlab, the embedding model) are only
+imported where they are used: importing the API stays fast and this warm-up is the one
+place where they are loaded on purpose. GET /readyz reports its progress.
+
+A failed step is retried with exponential backoff (capped) by the background warm-up;
+steps that already succeeded are not run again.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Backoff between attempts of the background warm-up: doubles from the first delay up to the cap
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "1"))
+WARMUP_RETRY_MAX_SECONDS = float(os.getenv("WARMUP_RETRY_MAX_SECONDS", "60"))
+
+
+def _load_data() -> None:
+    from services.market_data import market_data
+    market_data.prices()
+
+
+def _load_moments() -> None:
+    from services.market_data import market_data
+    from services.portfolio_engine import profile_moments
+    profile_moments(market_data.prices())
+
+
+def _load_profile_portfolios() -> None:
+    from services.portfolio_engine import precompute_profile_portfolios
+    precompute_profile_portfolios()
+
+
+def _load_frontier() -> None:
+    from services.market_data import market_data
+    from services.portfolio_engine import compute_efficient_frontier_points
+    compute_efficient_frontier_points(market_data.prices())
+
+
+def _load_rag() -> None:
+    from services import rag_engine
+    # Not fatal: recommendations fall back to a message until the index is available
+    if not rag_engine.warm_up():
+        logger.warning("RAG index unavailable after warm-up")
+
+
+def _load_pdf() -> None:
+    from services import report
+    report.warm_up()
+
+
+DEFAULT_STEPS: List[Tuple[str, Callable[[], None]]] = [
+    ("data", _load_data),
+    ("moments", _load_moments),
+    ("profile_portfolios", _load_profile_portfolios),
+    ("frontier", _load_frontier),
+    ("rag", _load_rag),
+    ("pdf", _load_pdf),
+]
+
+
+class WarmUp:
+    """Runs the warm-up steps in order, and keeps the readiness state and timings."""
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], None]]] = DEFAULT_STEPS):
+        self.steps = steps
+        self.ready = False
+        self.running = False
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.timings: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def run(self) -> bool:
+        """Run the steps not done yet (no-op once ready). Returns the readiness."""
+        with self._lock:
+            if self.ready:
+                return True
+            self.running, self.error = True, None
+            self.attempts += 1
+            try:
+                for name, step in self.steps:
+                    if name in self.timings:
+                        continue
+                    step_started = time.perf_counter()
+                    with timed(f"warmup_{name}"):
+                        step()
+                    self.timings[name] = time.perf_counter() - step_started
+                    logger.info("Warm-up %s: %.2fs", name, self.timings[name])
+            except Exception as e:
+                self.error = f"{name}: {e}"
+                logger.exception("Warm-up failed at step %s (attempt %d)", name, self.attempts)
+                return False
+            finally:
+                self.running = False
+            # Time spent in the steps, over every attempt
+            self.timings["total"] = sum(self.timings[name] for name, _ in self.steps)
+            self.ready = True
+            logger.info("Warm-up done in %.2fs (attempt %d)", self.timings["total"], self.attempts)
+            return True
+
+    def run_with_retry(self) -> bool:
+        """Run until ready, waiting WARMUP_RETRY_SECONDS (doubling, capped) between attempts, or until stopped."""
+        delay = WARMUP_RETRY_SECONDS
+        while not self.run():
+            if self._stopped.wait(delay):
+                return False
+            delay = min(2 * delay, WARMUP_RETRY_MAX_SECONDS)
+        return True
+
+    def start_background(self) -> threading.Thread:
+        """Run the warm-up, with retries, in a daemon thread (the worker serves /healthz meanwhile)."""
+        thread = threading.Thread(target=self.run_with_retry, name="warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        """Stop retrying (worker shutdown)."""
+        self._stopped.set()
+
+    def status(self) -> dict:
+        if self.ready:
+            state = "ready"
+        elif self.error is not None:
+            state = "failed"
+        else:
+            state = "warming_up"
+        return {"status": state, "error": self.error, "attempts": self.attempts, "timings": dict(self.timings)}
+
+
+worker_warmup = WarmUp()